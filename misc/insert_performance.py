@@ -1,16 +1,60 @@
 #!/usr/bin/env python
 
+from concurrent import futures
+import os
+import re
 import math
+import time
 import random
 import string
+import operator
+import functools
 import itertools
 import collections
+import multiprocessing as mp
 
 import tqdm
 
+import numpy as np
+
 import neo4j_utils
 
-__all__ = ['by_label', 'by_type', 'chunks', 'insert0', 'insert1', 'insert2', 'insert3', 'k_ids', 'main', 'random_nodes', 'random_rels', 'rstring', 'unique_labels']
+__all__ = ['BATCH_SIZES', 'by_label', 'by_type', 'chunks', 'column_chunks', 'insert0', 'insert1', 'insert2', 'insert3', 'insert4', 'insert5', 'insert_groups', 'iter_random_rels', 'k_ids', 'main', 'random_nodes', 'random_rels', 'rstring', 'run_batches', 'tune_batch_size', 'unique_labels']
+
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# translation tables mapping random bytes to characters, and the bytes
+# to drop: the ones beyond the largest multiple of the alphabet size,
+# otherwise the first characters of the alphabet would be more frequent
+_ALPHABET_TABLES = {
+    charclass: (
+        bytes(chars[i % len(chars)] for i in range(256)),
+        bytes(range(256 - 256 % len(chars), 256)),
+    )
+    for charclass, chars in (
+        (c, getattr(string, f'ascii_{c}').encode())
+        for c in ('letters', 'lowercase', 'uppercase')
+    )
+}
+
+
+def _random_chars(n, charclass):
+    """
+    Bytes of `n` random characters, each of them equally likely.
+    """
+
+    table, reject = _ALPHABET_TABLES[charclass]
+    result = b''
+
+    while len(result) < n:
+
+        # draw a bit more than missing, some bytes are dropped
+        size = n - len(result)
+        size += size // 8 + 8
+        result += os.urandom(size).translate(table, reject)
+
+    return result[:n]
 
 
 def rstring(l = 10, lower = False, title = False, upper = False):
@@ -20,31 +64,71 @@ def rstring(l = 10, lower = False, title = False, upper = False):
 
     charclass = 'lowercase' if lower else 'uppercase' if upper else 'letters'
 
-    chars = getattr(string, f'ascii_{charclass}')
-
-    result = ''.join(random.sample(chars, l))
+    result = _random_chars(l, charclass).decode('ascii')
 
     result = result.capitalize() if title else result
 
     return result
 
 
-def unique_labels(n, **kwargs):
+# below this size, `unique_labels` does not use NumPy
+_SMALL_N = 100
+
+
+def unique_labels(n, l = 10, lower = False, title = False, upper = False):
     """
-    Create a set with the desired number of unique random strings.
+    Create a list with the desired number of unique random strings.
     """
 
-    result = set()
+    n = int(n)
+    charclass = 'lowercase' if lower else 'uppercase' if upper else 'letters'
 
-    for i in range(int(1e4)):
+    if n <= _SMALL_N:
 
-        result.update({rstring(**kwargs) for _ in range(int(1e4))})
+        return _few_unique_labels(
+            n,
+            l = l,
+            charclass = charclass,
+            title = title,
+        )
 
-        if len(result) >= n:
+    dtype = f'S{l}'
 
-            break
+    result = np.array([], dtype = dtype)
+
+    while result.size < n:
 
-    return list(result)[:int(n)]
+        # draw a bit more than missing, as some will be duplicates
+        size = int((n - result.size) * 1.2) + 1
+        buf = _random_chars(size * l, charclass)
+        new = np.frombuffer(buf, dtype = dtype)
+        # capitalize before deduplicating: it lowercases all but the
+        # first character, so distinct strings might become equal
+        new = np.char.capitalize(new) if title else new
+        result = np.unique(np.concatenate((result, new)))
+
+    # np.unique returns sorted values: shuffle before truncating
+    result = np.random.permutation(result)[:n]
+
+    return result.astype(str).tolist()
+
+
+def _few_unique_labels(n, l, charclass, title = False):
+    """
+    Unique random strings without the overhead of NumPy, for small `n`.
+    """
+
+    result = set()
+
+    while len(result) < n:
+
+        size = max((n - len(result)) * 2, 16)
+        buf = _random_chars(size * l, charclass).decode('ascii')
+        new = (buf[i:i + l] for i in range(0, size * l, l))
+        new = (s.capitalize() for s in new) if title else new
+        result.update(new)
+
+    return list(result)[:n]
 
 
 def random_nodes(n = 1e5, nlabels = 1, nprops = 0) -> list[dict[str, str]]:
@@ -92,10 +176,25 @@ def random_rels(
         nlabels = 1,
         nnprops = 0,
         nrprops = 0,
+        columnar = False,
+        nworkers = 1,
+        seed = None,
 ):
     """
     A list of dicts, each represents a relation with the labels and IDs of
     the source and target nodes, the ID and type of the relation.
+
+    Args:
+        columnar:
+            Instead of a list of dicts, return a dict of lists, one list
+            for each field. Avoids creating one dict for each relation.
+        nworkers:
+            Generate the relations in this many processes, each producing
+            an equal share of them. The relation IDs are unique within a
+            share, across shares duplicates are unlikely but possible.
+        seed:
+            Seed for the random generators of the worker processes. By
+            default a random one is used.
     """
 
     types = [
@@ -109,31 +208,126 @@ def random_rels(
         random_nodes(nnodes, nlabels = nlabels, nprops = nnprops)
     )
 
-    edges = random_nodes(nrels, nlabels = ntypes, nprops = nrprops)
+    nrels = int(nrels)
 
-    result = []
-    counts = [10] * len(nodes)
-
-    result = [
-        dict(
-            source_label = anode['label'],
-            target_label = bnode['label'],
-            source_id = anode['ID'],
-            target_id = bnode['ID'],
-            ID = edge['ID'],
-            rel_type = edge['label'],
-            **dict(i for i in edge.items() if i[0].startswith('prop'))
-        )
-        for edge, anode, bnode in zip(
-            edges,
-            random.sample(nodes, len(edges), counts = counts),
-            random.sample(nodes, len(edges), counts = counts),
-        )
-    ]
+    if nworkers > 1:
+
+        seed = random.randrange(2 ** 32) if seed is None else seed
+        sizes = [
+            nrels // nworkers + (i < nrels % nworkers)
+            for i in range(nworkers)
+        ]
+
+        with mp.Pool(
+            nworkers,
+            initializer = _init_shard,
+            initargs = (nodes,),
+        ) as pool:
+
+            shards = pool.map(
+                _rel_shard,
+                [
+                    (seed + i, types, size, nrprops)
+                    for i, size in enumerate(sizes)
+                ],
+            )
+
+        result = {
+            k: list(itertools.chain.from_iterable(s[k] for s in shards))
+            for k in shards[0]
+        }
+
+    else:
+
+        result = _rel_columns(nodes, types, nrels, nrprops)
+
+    if not columnar:
+
+        result = [dict(zip(result, row)) for row in zip(*result.values())]
 
     return result, nodes
 
 
+def _rel_columns(nodes, types, n, nrprops = 0):
+    """
+    `n` random relations between `nodes`, as a dict of columns.
+    """
+
+    anodes = random.choices(nodes, k = n)
+    bnodes = random.choices(nodes, k = n)
+
+    return {
+        'source_label': [a['label'] for a in anodes],
+        'target_label': [b['label'] for b in bnodes],
+        'source_id': [a['ID'] for a in anodes],
+        'target_id': [b['ID'] for b in bnodes],
+        'ID': unique_labels(n),
+        'rel_type': random.choices(types, k = n),
+        **{f'prop{i}': unique_labels(n) for i in range(nrprops)},
+    }
+
+
+# the nodes in the worker processes of `random_rels`, set once by the pool
+# initializer instead of being pickled with each task
+_SHARD_NODES = None
+
+
+def _init_shard(nodes):
+
+    global _SHARD_NODES
+    _SHARD_NODES = nodes
+
+
+def _rel_shard(args):
+    """
+    Generate one share of the relations in a worker process.
+    """
+
+    seed, types, n, nrprops = args
+
+    # forked workers inherit the same generator states
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+
+    return _rel_columns(_SHARD_NODES, types, n, nrprops)
+
+
+def iter_random_rels(nodes, types, nrels = 2e6, nrprops = 0, batch_size = 1.5e4):
+    """
+    Random relations between `nodes`, generated in batches.
+
+    Unlike `random_rels`, only one batch exists in memory at a time. The
+    relation IDs are unique within a batch, across batches duplicates are
+    unlikely but not impossible.
+
+    Args:
+        nodes:
+            List of dicts, as returned by `random_nodes`.
+        types:
+            Relationship types, assigned randomly to the relations.
+        nrels:
+            Total number of relations.
+        nrprops:
+            Number of relation properties.
+        batch_size:
+            Number of relations in one batch.
+
+    Yields:
+        Dicts of columns, the same fields as in `random_rels`.
+    """
+
+    nrels, batch_size = int(nrels), int(batch_size)
+
+    for start in range(0, nrels, batch_size):
+
+        yield _rel_columns(
+            nodes,
+            types,
+            min(batch_size, nrels - start),
+            nrprops,
+        )
+
+
 def k_ids(total, k = 1, **kwargs) -> list[list[str]]:
     """
     `k` lists with `total / k` unique random strings in each. In other words,
@@ -154,13 +348,58 @@ def chunks(lst, n, pbar = True):
     """
 
     it = range(0, len(lst), int(n))
-    it = tqdm.tqdm(it) if pbar else it
+    it = tqdm.tqdm(it, mininterval = 1.0, smoothing = 0.1) if pbar else it
 
     for i in it:
 
         yield lst[i:i + int(n)]
 
 
+def column_chunks(columns, n):
+    """
+    Yields successive `n`-sized chunks from a dict of columns.
+    """
+
+    n = int(n)
+
+    for i in range(0, _nrows(columns), n):
+
+        yield {k: list(v[i:i + n]) for k, v in columns.items()}
+
+
+def _nrows(columns):
+
+    return len(next(iter(columns.values()), ()))
+
+
+def _as_columns(records, keys, prefix = None):
+    """
+    Columns of `keys` as object arrays, from a list of dicts or from columns.
+
+    Args:
+        prefix:
+            Prefix the keys in the result, see `_columns`. Only for lists
+            of dicts.
+    """
+
+    if isinstance(records, dict):
+
+        nrows = _nrows(records)
+
+        return {
+            k:
+                np.asarray(records[k], dtype = object)
+                    if k in records else
+                np.full(nrows, None, dtype = object)
+            for k in keys
+        }
+
+    return {
+        k: np.asarray(v, dtype = object)
+        for k, v in _columns(records, keys, prefix = prefix).items()
+    }
+
+
 def by_label(nodes):
     """
     Sorts nodes by their labels.
@@ -172,6 +411,8 @@ def by_label(nodes):
 def by_type(rels):
     """
     Sorts relations by their types and the types of the endpoints.
+
+    The relations can be either a list of dicts or a dict of columns.
     """
 
     return _group_by(rels, 'rel_type', 'source_label', 'target_label')
@@ -179,18 +420,403 @@ def by_type(rels):
 
 def _group_by(items, *keys):
 
+    if isinstance(items, dict):
+
+        return _group_columns(items, *keys)
+
     result = collections.defaultdict(list)
 
-    keys = sorted(keys)
+    getkey = operator.itemgetter(*keys)
 
     for it in items:
 
-        key = tuple(it[k] for k in keys)
+        result[getkey(it)].append(it)
+
+    return dict(result)
+
+
+def _group_columns(columns, *keys):
+    """
+    Group a dict of columns by the values in the `keys` columns.
+
+    The groups are found by sorting integer codes of the key combinations,
+    instead of looking up each row in a dict.
+    """
+
+    columns = {k: np.asarray(v, dtype = object) for k, v in columns.items()}
+    codes = np.zeros(_nrows(columns), dtype = np.int64)
+    levels = []
+
+    for k in keys:
+
+        uniq, inverse = np.unique(columns[k].astype(str), return_inverse = True)
+        codes = codes * len(uniq) + inverse.ravel()
+        levels.append(uniq.tolist())
+
+    order = np.argsort(codes, kind = 'stable')
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+
+    result = {}
+
+    for start, end in zip(starts, ends):
+
+        code = int(codes[start])
+        key = []
+
+        for level in reversed(levels):
+
+            code, i = divmod(code, len(level))
+            key.append(level[i])
+
+        key = tuple(reversed(key))
         key = key[0] if len(key) == 1 else key
+        idx = order[start:end]
 
-        result[key].append(it)
+        result[key] = {k: v[idx] for k, v in columns.items()}
 
-    return dict(result)
+    return result
+
+
+def _schema_names(labels, rel_types):
+    """
+    Node labels and relationship types, with the names of their indices.
+
+    Returns:
+        Two dicts, one for labels and one for relationship types, both
+        with the lowercase names used in index and constraint names as
+        values.
+
+    Raises:
+        ValueError: If a label or type can not be used as a Cypher
+            identifier without quoting.
+    """
+
+    labels, rel_types = set(labels), set(rel_types)
+
+    for name in labels | rel_types:
+
+        if not _IDENTIFIER_RE.fullmatch(name):
+
+            raise ValueError(f'Invalid label or relationship type: `{name}`.')
+
+    return (
+        {label: label.lower() for label in labels},
+        {rel_type: rel_type.lower() for rel_type in rel_types},
+    )
+
+
+def _create_schema(driver, labels, rel_types, node_key = True):
+    """
+    Create the ID indices or constraints and wait until they are online.
+
+    Args:
+        node_key:
+            Create NODE KEY constraints for the node IDs, instead of
+            plain indices. NODE KEY is available only in the Enterprise
+            edition: if it can not be created, a UNIQUE constraint is
+            created instead, and if even that fails, a plain index; the
+            MERGE queries need one of them to look up the nodes.
+    """
+
+    labels, rel_types = _schema_names(labels, rel_types)
+
+    print(
+        'Creating node key constraints'
+            if node_key else
+        'Creating node indices'
+    )
+
+    for label, name in labels.items():
+
+        queries = (
+            (
+                f'CREATE CONSTRAINT node_key_{name} IF NOT EXISTS '
+                f'FOR (n:{label}) REQUIRE n.ID IS NODE KEY',
+                f'CREATE CONSTRAINT node_unique_{name} IF NOT EXISTS '
+                f'FOR (n:{label}) REQUIRE n.ID IS UNIQUE',
+            )
+                if node_key else
+            ()
+        ) + (
+            f'CREATE INDEX node_id_{name} IF NOT EXISTS '
+            f'FOR (n:{label}) ON (n.ID)',
+        )
+
+        for query in queries:
+
+            _, summary = driver.query(query, raise_errors = False)
+
+            if summary is not None:
+
+                break
+
+            print(f'Failed: `{query}`, trying the next option')
+
+    print('Creating relation indices')
+    for rel_type, name in rel_types.items():
+
+        driver.query(
+            f'CREATE INDEX rel_id_{name} IF NOT EXISTS '
+            f'FOR ()-[r:{rel_type}]->() ON (r.ID)',
+        )
+
+    print('Deploying indices')
+    driver.query('CALL db.awaitIndexes()')
+
+
+@functools.lru_cache
+def _node_query(label):
+    """
+    Cypher to insert nodes of one label from columns.
+
+    Cached, so each group reuses the same query string across batches.
+    """
+
+    return (
+        'UNWIND range(0, size($ID) - 1) AS i\n'
+        f'MERGE (n:{label} {{ID: $ID[i]}})\n'
+        'ON CREATE SET\n'
+        'n.prop0 = $prop0[i],\n'
+        'n.prop1 = $prop1[i],\n'
+        'n.prop2 = $prop2[i]'
+    )
+
+
+@functools.lru_cache
+def _rel_query(rel_type, s_label, t_label, fuse_nodes = False):
+    """
+    Cypher to insert relations of one type from columns.
+
+    Args:
+        fuse_nodes:
+            MERGE the nodes instead of matching them, see `insert3`.
+
+    Cached, like `_node_query`.
+    """
+
+    match_nodes = (
+        f'MERGE (s:{s_label} {{ID: $source_id[i]}})\n'
+        'ON CREATE SET\n'
+        's.prop0 = $source_prop0[i],\n'
+        's.prop1 = $source_prop1[i],\n'
+        's.prop2 = $source_prop2[i]\n'
+        f'MERGE (t:{t_label} {{ID: $target_id[i]}})\n'
+        'ON CREATE SET\n'
+        't.prop0 = $target_prop0[i],\n'
+        't.prop1 = $target_prop1[i],\n'
+        't.prop2 = $target_prop2[i]\n'
+            if fuse_nodes else
+        f'MATCH (s:{s_label} {{ID: $source_id[i]}})\n'
+        f'MATCH (t:{t_label} {{ID: $target_id[i]}})\n'
+    )
+
+    return (
+        'UNWIND range(0, size($ID) - 1) AS i\n'
+        f'{match_nodes}'
+        f'MERGE (s)-[rel:{rel_type}]->(t)\n'
+        'SET\n'
+        'rel.ID = $ID[i],\n'
+        'rel.prop0 = $prop0[i],\n'
+        'rel.prop1 = $prop1[i]'
+    )
+
+
+def _node_ids(rels):
+    """
+    Set of node IDs at either end of the relations, in one pass.
+    """
+
+    return set(
+        itertools.chain.from_iterable(
+            map(operator.itemgetter('source_id', 'target_id'), rels),
+        ),
+    )
+
+
+def run_batches(driver, jobs, pbar = None, concurrency = 8):
+    """
+    Run batches of queries, keeping up to `concurrency` of them in flight.
+
+    Args:
+        driver:
+            A `neo4j_utils.Driver` instance.
+        jobs:
+            Pairs of Cypher queries and their parameters. The parameters
+            are columns: equal length lists, one for each field.
+        pbar:
+            A progress bar, updated by the number of rows.
+        concurrency:
+            Number of batches sent before waiting for the earlier ones to
+            finish. The batches run in separate sessions from a thread
+            pool, so their round trips overlap.
+    """
+
+    def run(job):
+
+        query, params = job
+        driver.query(query, parameters = params)
+
+        return _nrows(params)
+
+    def done(future):
+
+        n = future.result()
+
+        if pbar:
+
+            pbar.update(n = n)
+
+    pending = collections.deque()
+
+    with futures.ThreadPoolExecutor(max_workers = concurrency) as pool:
+
+        # jobs might be a generator producing the data on the fly:
+        # consume it only as fast as the batches are written
+        for job in jobs:
+
+            if len(pending) >= concurrency:
+
+                done(pending.popleft())
+
+            pending.append(pool.submit(run, job))
+
+        while pending:
+
+            done(pending.popleft())
+
+
+BATCH_SIZES = (5e3, 1.5e4, 5e4, 1e5)
+
+
+def insert_groups(
+        driver,
+        groups,
+        batch_size = None,
+        concurrency = 8,
+        desc = None,
+):
+    """
+    Insert groups of records in batches.
+
+    Args:
+        driver:
+            A `neo4j_utils.Driver` instance.
+        groups:
+            Pairs of Cypher queries and dicts of columns.
+        batch_size:
+            Number of rows in one batch. If `None`, it is tuned on the
+            first group by `tune_batch_size`.
+        concurrency:
+            Number of batches in flight, see `run_batches`.
+        desc:
+            Label of the progress bar.
+
+    Returns:
+        The batch size used.
+    """
+
+    groups = list(groups)
+    pbar = tqdm.tqdm(
+        desc = desc,
+        total = sum(_nrows(columns) for _, columns in groups),
+        mininterval = 1.0,
+        smoothing = 0.1,
+    )
+
+    if batch_size is None and groups:
+
+        query, columns = groups[0]
+        batch_size, done = tune_batch_size(driver, query, columns)
+        groups[0] = query, {k: v[done:] for k, v in columns.items()}
+        pbar.update(n = done)
+        pbar.set_description(f'{desc} (batch size: {batch_size})')
+
+    jobs = (
+        (query, batch)
+        for query, columns in groups
+        for batch in column_chunks(columns, batch_size)
+    )
+
+    run_batches(driver, jobs, pbar = pbar, concurrency = concurrency)
+    pbar.close()
+
+    return batch_size
+
+
+def tune_batch_size(driver, query, columns, sizes = BATCH_SIZES):
+    """
+    Select the batch size with the highest throughput.
+
+    Inserts one batch of each size from the beginning of `columns` and
+    measures the rows written per second. Only the sizes for which enough
+    rows are available are compared.
+
+    Args:
+        driver:
+            A `neo4j_utils.Driver` instance.
+        query:
+            The Cypher query, taking the columns as parameters.
+        columns:
+            Dict of columns, see `run_batches`.
+        sizes:
+            Batch sizes to compare.
+
+    Returns:
+        The best batch size and the number of rows already inserted.
+    """
+
+    best_rate, best_size = 0, int(sizes[0])
+    done = 0
+
+    for size in map(int, sizes):
+
+        batch = {k: list(v[done:done + size]) for k, v in columns.items()}
+        n = _nrows(batch)
+
+        if not n:
+
+            break
+
+        t0 = time.perf_counter()
+        driver.query(query, parameters = batch)
+        rate = n / (time.perf_counter() - t0)
+        done += n
+
+        if n < size:
+
+            break
+
+        if rate > best_rate:
+
+            best_rate, best_size = rate, size
+
+    return best_size, done
+
+
+def _sort_columns(columns, key):
+    """
+    Sort a dict of columns by the values in one of them.
+    """
+
+    order = np.argsort(columns[key])
+
+    return {k: v[order] for k, v in columns.items()}
+
+
+def _columns(records, keys, prefix = None):
+    """
+    Turn a list of dicts into a dict of lists, one list for each key.
+
+    Args:
+        prefix:
+            Prefix the keys in the result, separated by an underscore.
+    """
+
+    prefix = f'{prefix}_' if prefix else ''
+
+    return {f'{prefix}{k}': [r.get(k) for r in records] for k in keys}
 
 
 def insert0(driver, data = None, batch_size = 1.5e4, **kwargs):
@@ -215,12 +841,7 @@ def insert1(driver, data = None, batch_size = 1.5e4, **kwargs):
 
     data = data or random_rels(**kwargs)
 
-    nodes = list(
-        sorted(
-            {d['source_id'] for d in data} |
-            {d['target_id'] for d in data},
-        ),
-    )
+    nodes = list(_node_ids(data))
 
     driver.query('CREATE INDEX node_id IF NOT EXISTS FOR (n:Anything) ON (n.ID)')
     driver.query('CREATE LOOKUP INDEX node_la IF NOT EXISTS FOR (n) ON EACH labels(n)')
@@ -232,27 +853,14 @@ def insert1(driver, data = None, batch_size = 1.5e4, **kwargs):
 
     for batch in chunks(nodes, batch_size):
 
-        batch = [{'node_id': x} for x in batch]
-
         driver.query(
             """
-            UNWIND $entities AS ent
-            MERGE (n:Anything {ID: ent.node_id})
+            UNWIND $ids AS nid
+            MERGE (n:Anything {ID: nid})
             """,
-            parameters = {'entities': batch},
+            parameters = {'ids': batch},
         )
 
-    print('Creating node text index.')
-    driver.query('CREATE TEXT INDEX node_it IF NOT EXISTS FOR (n:Anything) ON (n.ID)')
-    driver.query('CALL db.awaitIndexes()')
-
-    data = list(
-        sorted(
-            data,
-            key = lambda r: (r['source_id'], r['target_id']),
-        ),
-    )
-
     for batch in chunks(data, batch_size):
 
         driver.query(
@@ -266,19 +874,12 @@ def insert1(driver, data = None, batch_size = 1.5e4, **kwargs):
             parameters = {'entities': batch},
         )
 
-    print('Creating rel text index.')
-    driver.query('CREATE TEXT INDEX rel_it IF NOT EXISTS FOR ()-[r:Rel]->() ON (r.ID)')
-    driver.query('CALL db.awaitIndexes()')
-
 
 def insert2(driver, data = None, batch_size = 1.5e4, **kwargs):
 
     data = data or random_rels(**kwargs)
 
-    nodes = list(
-        {d['source_id'] for d in data} |
-        {d['target_id'] for d in data},
-    )
+    nodes = list(_node_ids(data))
 
     # driver.query('CREATE CONSTRAINT node_id IF NOT EXISTS FOR (n:Anything) REQUIRE n.ID IS UNIQUE')
     driver.query('CREATE CONSTRAINT node_id IF NOT EXISTS FOR (n:Anything) REQUIRE n.ID IS NODE KEY')
@@ -288,14 +889,12 @@ def insert2(driver, data = None, batch_size = 1.5e4, **kwargs):
 
     for batch in chunks(nodes, batch_size):
 
-        batch = [{'node_id': x} for x in batch]
-
         driver.query(
             """
-            UNWIND $entities AS ent
-            MERGE (n:Anything {ID: ent.node_id})
+            UNWIND $ids AS nid
+            MERGE (n:Anything {ID: nid})
             """,
-            parameters = {'entities': batch},
+            parameters = {'ids': batch},
         )
 
     for batch in chunks(data, batch_size):
@@ -312,90 +911,284 @@ def insert2(driver, data = None, batch_size = 1.5e4, **kwargs):
         )
 
 
-def insert3(driver, edges = None, nodes = None, batch_size = 1.5e4, **kwargs):
+def insert3(
+        driver,
+        edges = None,
+        nodes = None,
+        batch_size = None,
+        concurrency = 8,
+        sort_by_id = False,
+        fuse_nodes = False,
+        **kwargs,
+):
+    """
+    Insert nodes and relations grouped by label and type.
+
+    Args:
+        batch_size:
+            Number of records in one query. By default it is selected by
+            `tune_batch_size`, separately for nodes and relations.
+        concurrency:
+            Number of batches in flight, see `run_batches`.
+        sort_by_id:
+            Sort the records of each label and type by their IDs before
+            inserting them. MERGE looks up the IDs in the index, the input
+            order does not matter for it, hence this is disabled by default.
+        fuse_nodes:
+            Skip the separate node insert, and MERGE the nodes together
+            with the relations, in the same query. This way the data is
+            processed in one pass instead of two, but nodes without any
+            relation are not inserted.
+    """
 
     if not nodes or not edges:
 
         print('Generating random data')
-        edges, nodes = random_rels(**kwargs)
+        edges, nodes = random_rels(columnar = True, **kwargs)
 
     print('Grouping nodes and relations')
     nodes = by_label(nodes)
     edges = by_type(edges)
 
-    print('Creating node indices')
-    for label in nodes.keys():
+    _create_schema(driver, nodes.keys(), (k[0] for k in edges.keys()))
 
-        driver.query(
-            f'CREATE INDEX node_id_{label.lower()} IF NOT EXISTS '
-            f'FOR (n:{label}) ON (n.ID)',
-        )
+    node_fields = ('ID', 'prop0', 'prop1', 'prop2')
+    edge_fields = ('source_id', 'target_id', 'ID', 'prop0', 'prop1')
 
-    print('Creating relation indices')
-    for rtype in edges.keys():
+    if fuse_nodes:
 
-        driver.query(
-            f'CREATE INDEX rel_id_{rtype[0].lower()} IF NOT EXISTS '
-            f'FOR ()-[r:{rtype[0]}]->() ON (r.ID)',
+        node_by_id = {n['ID']: n for _nodes in nodes.values() for n in _nodes}
+
+    nodes = {
+        label: _as_columns(_nodes, node_fields)
+        for label, _nodes in nodes.items()
+    }
+    edges = {
+        group: _as_columns(_edges, edge_fields)
+        for group, _edges in edges.items()
+    }
+
+    if sort_by_id:
+
+        nodes = {k: _sort_columns(v, 'ID') for k, v in nodes.items()}
+        edges = {k: _sort_columns(v, 'ID') for k, v in edges.items()}
+
+    if fuse_nodes:
+
+        for columns in edges.values():
+
+            for end in ('source', 'target'):
+
+                end_nodes = [node_by_id[i] for i in columns[f'{end}_id']]
+                columns.update(
+                    _as_columns(end_nodes, node_fields[1:], prefix = end),
+                )
+
+    else:
+
+        node_groups = [
+            (_node_query(label), columns)
+            for label, columns in nodes.items()
+        ]
+
+        insert_groups(
+            driver,
+            node_groups,
+            batch_size = batch_size,
+            concurrency = concurrency,
+            desc = 'Inserting nodes',
         )
 
-    print('Deploying indices')
-    driver.query('CALL db.awaitIndexes()')
+    edge_groups = [
+        (_rel_query(*group, fuse_nodes = fuse_nodes), columns)
+        for group, columns in edges.items()
+    ]
 
-    node_bar = tqdm.tqdm(
-        desc = 'Inserting nodes',
-        total = sum(map(len, nodes.values())),
+    insert_groups(
+        driver,
+        edge_groups,
+        batch_size = batch_size,
+        concurrency = concurrency,
+        desc = 'Inserting relations',
     )
 
-    for label, _nodes in nodes.items():
 
-        _nodes = sorted(_nodes, key = lambda n: n['ID'])
+_SERVER_BATCHING = {
+    'concurrent': (
+        'UNWIND $entities AS ent\n'
+        'CALL {{\n'
+        'WITH ent\n'
+        '{body}\n'
+        '}} IN CONCURRENT TRANSACTIONS OF {batch_size} ROWS'
+    ),
+    'transactions': (
+        'UNWIND $entities AS ent\n'
+        'CALL {{\n'
+        'WITH ent\n'
+        '{body}\n'
+        '}} IN TRANSACTIONS OF {batch_size} ROWS'
+    ),
+    'apoc': (
+        'CALL apoc.periodic.iterate(\n'
+        "'UNWIND $entities AS ent RETURN ent',\n"
+        "'{body}',\n"
+        '{{batchSize: {batch_size}, parallel: true, '
+        'params: {{entities: $entities}}}}\n'
+        ')'
+    ),
+}
+
+
+def insert4(
+        driver,
+        edges = None,
+        nodes = None,
+        batch_size = 1e4,
+        method = 'concurrent',
+        **kwargs,
+):
+    """
+    Insert with batching done by the server.
 
-        for batch in chunks(_nodes, batch_size, pbar = False):
+    All records of one label or relationship type are sent in a single
+    query, the server splits them into transactions of `batch_size` rows.
 
-            node_bar.set_description(f'Inserting {len(batch)} nodes')
+    Args:
+        method:
+            `concurrent` uses ``CALL {} IN CONCURRENT TRANSACTIONS``
+            (Neo4j 5.21+), `transactions` the serial variant of it (4.4+),
+            `apoc` uses ``apoc.periodic.iterate`` with ``parallel: true``.
+            Parallel relationship inserts might run into lock contention
+            on shared nodes.
+    """
 
-            driver.query(
-                'UNWIND $entities AS ent\n'
-                f'MERGE (n:{label} '
-                '{ID: ent.ID, '
-                'prop0: ent.prop0, '
-                'prop1: ent.prop1, '
-                'prop2: ent.prop2})\n',
-                parameters = {'entities': batch},
-            )
+    if not nodes or not edges:
+
+        print('Generating random data')
+        edges, nodes = random_rels(**kwargs)
 
-            node_bar.update(n = len(batch))
+    template = _SERVER_BATCHING[method]
+    batch_size = int(batch_size)
 
-    node_bar.close()
+    print('Grouping nodes and relations')
+    nodes = by_label(nodes)
+    edges = by_type(edges)
 
-    edge_bar = tqdm.tqdm(
-        desc = 'Inserting relations',
-        total = sum(map(len, edges.values())),
+    _create_schema(
+        driver,
+        nodes.keys(),
+        (k[0] for k in edges.keys()),
+        node_key = False,
     )
 
-    for (rel_type, s_label, t_label), _edges in edges.items():
+    for label, _nodes in tqdm.tqdm(nodes.items(), desc = 'Inserting nodes'):
+
+        body = (
+            f'MERGE (n:{label} {{ID: ent.ID}}) '
+            'ON CREATE SET n.prop0 = ent.prop0, '
+            'n.prop1 = ent.prop1, '
+            'n.prop2 = ent.prop2'
+        )
+
+        driver.query(
+            template.format(body = body, batch_size = batch_size),
+            parameters = {'entities': _nodes},
+        )
 
-        _edges = sorted(_edges, key = lambda e: e['ID'])
+    for (rel_type, s_label, t_label), _edges in tqdm.tqdm(
+        edges.items(),
+        desc = 'Inserting relations',
+    ):
+
+        body = (
+            f'MATCH (s:{s_label} {{ID: ent.source_id}}) '
+            f'MATCH (t:{t_label} {{ID: ent.target_id}}) '
+            f'MERGE (s)-[rel:{rel_type}]->(t) '
+            'SET rel.ID = ent.ID, '
+            'rel.prop0 = ent.prop0, '
+            'rel.prop1 = ent.prop1'
+        )
 
-        for batch in chunks(_edges, batch_size, pbar = False):
+        driver.query(
+            template.format(body = body, batch_size = batch_size),
+            parameters = {'entities': _edges},
+        )
 
-            edge_bar.set_description(f'Inserting {len(batch)} relations')
 
-            driver.query(
-                'UNWIND $entities AS ent\n'
-                f'MATCH (s:{s_label} {{ID: ent.source_id}})\n'
-                f'MATCH (t:{t_label} {{ID: ent.target_id}})\n'
-                f'MERGE (s)-[rel:{rel_type}]->(t)\n'
-                'SET\n'
-                'rel.ID = ent.ID,\n'
-                'rel.prop0 = ent.prop0,\n'
-                'rel.prop1 = ent.prop1',
-                parameters = {'entities': batch},
-            )
+def insert5(
+        driver,
+        nnodes = 1e6,
+        nlabels = 1,
+        nnprops = 0,
+        ntypes = 1,
+        batch_size = 1.5e4,
+        concurrency = 8,
+        **kwargs,
+):
+    """
+    Insert random relations while generating them.
 
-            edge_bar.update(n = len(batch))
+    The nodes are generated and inserted first, as in `insert3`. Then the
+    relations are generated batch by batch by `iter_random_rels`, and each
+    batch is generated while the previous ones are being written, so the
+    whole data never has to be in memory.
+
+    Args:
+        kwargs:
+            Passed to `iter_random_rels`.
+    """
+
+    print('Generating random nodes')
+    nodes = random_nodes(nnodes, nlabels = nlabels, nprops = nnprops)
+    types = [
+        rstring(l = 10, lower = True, title = True)
+        for _ in range(ntypes)
+    ]
+    node_fields = ('ID', 'prop0', 'prop1', 'prop2')
+    edge_fields = ('source_id', 'target_id', 'ID', 'prop0', 'prop1')
+
+    nodes_by_label = by_label(nodes)
+
+    _create_schema(driver, nodes_by_label.keys(), types)
+
+    insert_groups(
+        driver,
+        [
+            (_node_query(label), _as_columns(_nodes, node_fields))
+            for label, _nodes in nodes_by_label.items()
+        ],
+        batch_size = batch_size,
+        concurrency = concurrency,
+        desc = 'Inserting nodes',
+    )
+
+    rels = iter_random_rels(
+        nodes,
+        types,
+        batch_size = batch_size,
+        **kwargs
+    )
+
+    jobs = (
+        (
+            _rel_query(*group),
+            {
+                k: v.tolist()
+                for k, v in _as_columns(columns, edge_fields).items()
+            },
+        )
+        for batch in rels
+        for group, columns in by_type(batch).items()
+    )
+
+    edge_bar = tqdm.tqdm(
+        desc = 'Inserting relations',
+        total = int(kwargs.get('nrels', 2e6)),
+        mininterval = 1.0,
+        smoothing = 0.1,
+    )
 
+    run_batches(driver, jobs, pbar = edge_bar, concurrency = concurrency)
     edge_bar.close()
 
 
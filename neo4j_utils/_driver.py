@@ -20,18 +20,26 @@ from __future__ import annotations
 
 from ._logger import logger, log_traceback
 
-logger.debug(f'Loading module {__name__.strip("_")}.')
+logger.debug('Loading module %s.', __name__.strip('_'))
 
-from typing import Literal
+from typing import Any, Literal, Callable, Iterable
+from pathlib import Path
 import os
 import re
+import sys
+import copy
+import json
+import stat
+import time
+import asyncio
+import weakref
 import builtins
+import tempfile
 import warnings
-import importlib as imp
-import itertools
+import functools
+import threading
 import contextlib
 
-import yaml
 import neo4j
 import appdirs
 import neo4j.exceptions as neo4j_exc
@@ -45,21 +53,332 @@ __all__ = ['CONFIG_FILES', 'DEFAULT_CONFIG', 'Driver']
 
 
 CONFIG_FILES = Literal['neo4j.yaml', 'neo4j.yml']
+# config files looked up if none is provided, in the order of priority
+_CONFIG_CANDIDATES = tuple(
+    Path(confdir, conffile)
+    for confdir in (
+        appdirs.user_config_dir('neo4j-utils', 'saezlab'),
+        '.',
+    )
+    for conffile in reversed(CONFIG_FILES.__args__)
+)
 DEFAULT_CONFIG = {
     'user': 'neo4j',
     'passwd': 'neo4j',
     'db': 'neo4j',
     'uri': 'neo4j://localhost:7687',
+    # records per round trip, for streamed queries and properties
     'fetch_size': 1000,
     'raise_errors': False,
     'fallback_db': ('system', 'neo4j'),
     'fallback_on': ('TransientError',),
 }
+# alternative names of the keys in the config files
+_CONFIG_KEY_SYNONYMS = {
+    'password': 'passwd',
+    'pw': 'passwd',
+    'username': 'user',
+    'login': 'user',
+    'host': 'uri',
+    'address': 'uri',
+    'server': 'uri',
+    'graph': 'db',
+    'database': 'db',
+    'name': 'db',
+}
+# parsed config files by path, modification time and size
+_YAML_CACHE = {}
+_YAML_CACHE_SIZE = 32
+_CONFIG_FILE_CACHE = {}
+# neo4j drivers shared by the `Driver` objects connecting to the same
+# server as the same user: (uri, auth) -> [driver, number of users]
+_DRIVER_POOL = {}
+_DRIVER_POOL_LOCK = threading.Lock()
+# `verify_connectivity` is marked as experimental in v4 of the driver;
+# filtered once here instead of catching warnings at each call
+warnings.filterwarnings(
+    'ignore',
+    message = 'The configuration may change in the future',
+    category = getattr(neo4j, 'ExperimentalWarning', Warning),
+)
+_IDX_CSTR_SYNONYMS = {
+    'indexes': 'INDEX',
+    'indices': 'INDEX',
+    'constraints': 'CONSTRAINT',
+}
+# seconds to reuse the result of `SHOW DATABASES`
+_DATABASES_TTL = 1.0
+# seconds to reuse the labels, types, counts, etc. queried from the database
+_SCHEMA_TTL = 10.0
+# session arguments for writing (True) and reading (False)
+_SESSION_ARGS = {
+    True: {'default_access_mode': neo4j.WRITE_ACCESS},
+    False: {'default_access_mode': neo4j.READ_ACCESS},
+}
+# schema properties: the procedure listing them and its output field
+_SCHEMA_QUERIES = {
+    'labels': ('CALL db.labels', 'label'),
+    'rel_types': ('CALL db.relationshipTypes', 'relationshipType'),
+    'prop_keys': ('CALL db.propertyKeys', 'propertyKey'),
+}
+# query summary counters of changes which might affect the cached labels,
+# types and counts
+_STRUCTURE_COUNTERS = (
+    'nodes_created',
+    'nodes_deleted',
+    'labels_added',
+    'labels_removed',
+    'relationships_created',
+    'relationships_deleted',
+)
+# nodes deleted in one transaction by `wipe_db`
+_WIPE_BATCH_SIZE = 10000
+# `None`, i.e. the default database of the server
+_DEFAULT_DATABASE = neo4j.DEFAULT_DATABASE
+_CAMEL_RE = re.compile(r'(?<=[a-z])(?=[A-Z])')
+# queries which manage their own transactions, hence can not run in a
+# transaction function
+_AUTOCOMMIT_RE = re.compile(
+    r'\bIN\s+(CONCURRENT\s+)?TRANSACTIONS\b|\bPERIODIC\s+COMMIT\b',
+    re.IGNORECASE,
+)
+
+
+def _load_yaml(path: str) -> dict:
+    """
+    Read a YAML file, reusing the result if the file has not changed.
+
+    Args:
+        path:
+            Path to the YAML file.
+
+    Returns:
+        The contents of the file, a copy of the cached object, so callers
+        are free to modify it.
+
+    Note:
+        The cache lives only in the current process. Config files are
+        a few lines, libyaml parses them in well under a millisecond, so
+        a persistent cache, e.g. compiled into a Python module, would
+        not pay off, and loading it would mean executing code found next
+        to the config.
+    """
+
+    # yaml is imported only here and in `write_config`, as most of the
+    # times no config file is used
+    import yaml
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    if key not in _YAML_CACHE:
+
+        # the libyaml based loader is much faster, if PyYAML is built with it
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+        with open(path) as fp:
+
+            content = yaml.load(fp, Loader = loader)
+
+        if len(_YAML_CACHE) >= _YAML_CACHE_SIZE:
+
+            # dicts keep insertion order: drop the oldest entry
+            del _YAML_CACHE[next(iter(_YAML_CACHE))]
+
+        _YAML_CACHE[key] = content
+
+    return copy.deepcopy(_YAML_CACHE[key])
+
+
+def _discover_config_file() -> str | None:
+    """
+    The first existing config file among the default locations.
+
+    A file once found is remembered while it exists. If none is found,
+    the next call searches again, and `Driver.write_config` clears
+    the memory, so files created later in the process are noticed.
+    """
+
+    found = _CONFIG_FILE_CACHE.get('path')
+
+    if found is None or not os.path.isfile(found):
+
+        found = _CONFIG_FILE_CACHE['path'] = next(
+            (str(p) for p in _CONFIG_CANDIDATES if p.is_file()),
+            None,
+        )
+
+    return found
+
+
+def _schema_snapshot(tx: neo4j.Transaction) -> dict[str, list[str]]:
+    """
+    Labels, relationship types and property keys: a transaction function.
+    """
+
+    return {
+        key: [sys.intern(r[field]) for r in tx.run(query)]
+        for key, (query, field) in _SCHEMA_QUERIES.items()
+    }
+
+
+def _meta_stats(tx: neo4j.Transaction) -> dict:
+    """
+    Node and relationship counts by APOC: a transaction function.
+    """
+
+    return tx.run(
+        'CALL apoc.meta.stats() '
+        'YIELD labels, relTypesCount, nodeCount, relCount '
+        'RETURN labels, relTypesCount, nodeCount, relCount;',
+    ).single().data()
+
+
+def _store_counts(
+        tx: neo4j.Transaction,
+        procedure: str,
+        pattern: str,
+) -> dict[str, int]:
+    """
+    Counts by labels or types from the count store: a transaction function.
+
+    See `Driver._store_counts`.
+    """
+
+    names = [name for name, in tx.run(f'CALL {procedure}')]
+
+    if not names:
+
+        return {}
+
+    query = ' UNION ALL '.join(
+        # no grouping key in the aggregation, otherwise the planner
+        # does not read the count from the count store
+        f'MATCH {pattern.format(_backtick(name))} '
+        f'WITH COUNT(*) AS count '
+        f'RETURN $names[{i}] AS name, count'
+        for i, name in enumerate(names)
+    )
+
+    # records are tuples: unpacking them is cheaper than key lookups
+    return {
+        sys.intern(name): count
+        for name, count in tx.run(query, names = names)
+        if count
+    }
+
+
+def _str_to_exc(e: Exception | type | str) -> type | str:
+    """
+    The class of an exception, looked up by name if a string is provided.
+    """
+
+    return (
+        e.__class__
+            if isinstance(e, Exception) else
+        getattr(builtins, e, getattr(neo4j_exc, e, e))
+            if isinstance(e, str) else
+        e
+    )
+
+
+@functools.lru_cache(maxsize = 64)
+def _exc_classes(errors: frozenset) -> tuple[type, ...]:
+    """
+    Exception classes from names, classes or instances.
+
+    The names are looked up only once for each combination of errors.
+    """
+
+    return tuple(
+        e
+        for e in map(_str_to_exc, errors)
+        if isinstance(e, type)
+    )
+
+
+def _json_default(obj: Any) -> list:
+    """
+    Sets as lists for `json.dumps`: e.g. `fallback_on` might be a set.
+    """
+
+    if isinstance(obj, (set, frozenset)):
+
+        return sorted(obj, key = str)
+
+    raise TypeError(
+        f'Object of type {obj.__class__.__name__} is not JSON serializable',
+    )
+
+
+def _log_error(message: str, e: BaseException):
+    """
+    Log an error message with an exception, as `printer.error_str` does.
+
+    The exception is formatted only if the record is emitted.
+    """
+
+    # the record refers to the caller, not to this function
+    logger.error('%s: %s: %s', message, e.__class__.__name__, e, stacklevel = 2)
+
+
+def _backtick(name: str) -> str:
+    """
+    Quote a label, type or other name for use in Cypher.
+    """
+
+    return '`%s`' % name.replace('`', '``')
+
+
+def _acquire_driver(key: tuple[str, tuple]) -> neo4j.Driver:
+    """
+    A neo4j driver from the pool, created if necessary.
+
+    Args:
+        key:
+            URI and authentication tuple.
+    """
+
+    with _DRIVER_POOL_LOCK:
+
+        if key not in _DRIVER_POOL:
+
+            uri, auth = key
+            _DRIVER_POOL[key] = [
+                neo4j.GraphDatabase.driver(uri = uri, auth = auth),
+                0,
+            ]
+
+        _DRIVER_POOL[key][1] += 1
+
+        return _DRIVER_POOL[key][0]
+
+
+def _release_driver(key: tuple[str, tuple]):
+    """
+    Give back a driver to the pool, close it if it is not used any more.
+    """
+
+    with _DRIVER_POOL_LOCK:
+
+        if key not in _DRIVER_POOL:
+
+            return
+
+        _DRIVER_POOL[key][1] -= 1
+
+        if _DRIVER_POOL[key][1] <= 0:
+
+            driver, _ = _DRIVER_POOL.pop(key)
+            driver.close()
 
 
 class Driver:
     """
     Manage the connection to the Neo4j server.
+
+    Call :py:meth:`close` when the object is not needed any more, so the
+    connections of the shared neo4j driver can be released.
     """
 
     _connect_essential = ('uri', 'user', 'passwd')
@@ -79,6 +398,7 @@ class Driver:
             fallback_db: str | tuple[str] | None = None,
             fallback_on: str | set[str] | None = None,
             multi_db: bool | None = None, # legacy parameter for pre-4.0 DBs
+            eager_init: bool = False,
             **kwargs
     ):
         """
@@ -106,7 +426,11 @@ class Driver:
             db_passwd:
                 Password of the Neo4j user.
             fetch_size:
-                Optional; the fetch size to use in database transactions.
+                Optional; the fetch size to use in database transactions:
+                the number of records retrieved in one round trip to the
+                server. Applies to streamed queries and to the
+                properties read from the database; queries returning
+                lists retrieve all records at once.
             raise_errors:
                 Raise the errors instead of turning them into log messages
                 and returning `None`.
@@ -131,11 +455,24 @@ class Driver:
                 another database, but especially for database and server
                 management commands this is a convenient solution.
             multi_db:
-                Not sure what is this for, biocypher requires it.
+                Set it to `False` for servers before v4.0, which have only
+                one database: the sessions won't be told the name of the
+                database. Otherwise the name is always passed, so the
+                server does not have to look up the default database of
+                the user for each session.
+            eager_init:
+                Make sure the database exists and is online already here.
+                By default this is done only before the first interaction
+                with the server, so creating this object does not wait
+                for round trips to the server.
             kwargs:
                 Ignored.
         """
 
+        self._sessions = threading.local()
+        # all sessions, without keeping them alive, for `close`
+        self._open_sessions = weakref.WeakSet()
+        self._sessions_lock = threading.Lock()
         self.driver = getattr(driver, 'driver', driver)
         self._db_config = {
             'uri': db_uri,
@@ -149,8 +486,13 @@ class Driver:
         }
         self._config_file = config
         self._drivers = {}
+        self._pool_keys = set()
+        self._db_names = {}
+        self._schema_cache = {}
+        self._apoc_state = None
         self._queries = {}
         self._offline = offline
+        self._ensure_pending = True
         self.multi_db = multi_db
 
         if self.driver:
@@ -167,7 +509,9 @@ class Driver:
             )
             self.db_connect()
 
-        self.ensure_db()
+        if eager_init or wipe:
+
+            self.ensure_db()
 
         if wipe:
 
@@ -177,11 +521,15 @@ class Driver:
     def reload(self):
         """
         Reloads the object from the module level.
+
+        For development only: reloading the module discards its module
+        level state, such as the config cache and the shared drivers.
         """
 
+        import importlib
+
         modname = self.__class__.__module__
-        mod = __import__(modname, fromlist=[modname.split('.')[0]])
-        imp.reload(mod)
+        mod = importlib.reload(sys.modules[modname])
         new = getattr(mod, self.__class__.__name__)
         self.__class__ = new
 
@@ -194,12 +542,18 @@ class Driver:
         current configuration.
         """
 
+        self._db_names = {}
+        self._schema_cache = {}
+        self._apoc_state = None
+
         if not self._connect_param_available:
 
             self.read_config()
 
-        con_param = printer.dict_str({'uri': self.uri, 'auth': self.auth})
-        logger.info(f'Attempting to connect: {con_param}')
+        logger.info(
+            'Attempting to connect: %s',
+            printer.dict_str({'uri': self.uri, 'auth': self.auth}),
+        )
 
         if self.offline:
 
@@ -208,10 +562,17 @@ class Driver:
 
         else:
 
-            self.driver = neo4j.GraphDatabase.driver(
-                uri = self.uri,
-                auth = self.auth,
-            )
+            key = (self.uri, self.auth)
+
+            if key in self._pool_keys:
+
+                self.driver = _DRIVER_POOL[key][0]
+
+            else:
+
+                self.driver = _acquire_driver(key)
+                self._pool_keys.add(key)
+
             logger.info('Opened database connection.')
 
 
@@ -227,10 +588,9 @@ class Driver:
         a connection?
         """
 
-        return all(
-            self._db_config.get(k, None)
-            for k in self._connect_essential
-        )
+        config = self._db_config
+
+        return all(config.get(k) for k in self._connect_essential)
 
 
     @property
@@ -290,44 +650,23 @@ class Driver:
         config file.
         """
 
-        config_key_synonyms = {
-            'password': 'passwd',
-            'pw': 'passwd',
-            'username': 'user',
-            'login': 'user',
-            'host': 'uri',
-            'address': 'uri',
-            'server': 'uri',
-            'graph': 'db',
-            'database': 'db',
-            'name': 'db',
-        }
-
-        if not self._config_file or not os.path.exists(self._config_file):
-
-            confdirs = ('.', appdirs.user_config_dir('neo4j-utils', 'saezlab'))
-            conffiles = CONFIG_FILES.__args__
-
-            for config_path_t in itertools.product(confdirs, conffiles):
+        config_file = self._config_file
 
-                config_path_s = os.path.join(*config_path_t)
+        if not config_file or not Path(config_file).is_file():
 
-                if os.path.exists(config_path_s):
+            config_file = _discover_config_file()
+            self._config_file = config_file or self._config_file
 
-                    self._config_file = config_path_s
-
-        if self._config_file and os.path.exists(self._config_file):
+        if config_file:
 
             logger.info('Reading config from `%s`.' % self._config_file)
 
-            with open(self._config_file) as fp:
-
-                conf = yaml.safe_load(fp.read())
+            conf = _load_yaml(self._config_file)
 
             for k, v in conf.get(section, conf).items():
 
                 k = k.lower()
-                k = config_key_synonyms.get(k, k)
+                k = _CONFIG_KEY_SYNONYMS.get(k, k)
 
                 if not self._db_config.get(k, None):
 
@@ -357,11 +696,12 @@ class Driver:
             'passwd': self.passwd,
         }
 
-        for k, v in from_driver.items():
-
-            self._db_config[k] = self._db_config.get(k, v) or v
-
-        self._config_from_defaults()
+        # precedence: user provided, from the driver, defaults
+        self._db_config = {
+            **DEFAULT_CONFIG,
+            **{k: v for k, v in from_driver.items() if v is not None},
+            **{k: v for k, v in self._db_config.items() if v is not None},
+        }
 
 
     def _config_from_defaults(self):
@@ -369,11 +709,10 @@ class Driver:
         Populates missing config items by their default values.
         """
 
-        for k, v in DEFAULT_CONFIG.items():
-
-            if self._db_config.get(k, None) is None:
-
-                self._db_config[k] = v
+        self._db_config = {
+            **DEFAULT_CONFIG,
+            **{k: v for k, v in self._db_config.items() if v is not None},
+        }
 
 
     def _register_current_driver(self):
@@ -394,16 +733,25 @@ class Driver:
     def close(self):
         """
         Closes the Neo4j driver if it exists and is open.
+
+        Drivers created by this object are shared with other objects
+        connecting to the same server as the same user; these are closed
+        only when none of the objects uses them any more.
         """
 
-        if hasattr(self, 'driver') and hasattr(self.driver, 'close'):
+        self._close_sessions()
 
-            self.driver.close()
+        pool_keys = getattr(self, '_pool_keys', None)
 
+        if pool_keys:
 
-    def __del__(self):
+            while pool_keys:
 
-        self.close()
+                _release_driver(pool_keys.pop())
+
+        elif hasattr(self, 'driver') and hasattr(self.driver, 'close'):
+
+            self.driver.close()
 
 
     @property
@@ -428,6 +776,16 @@ class Driver:
             self,
             which: Literal['HOME', 'DEFAULT'] = 'HOME',
     ) -> str | None:
+        """
+        Name of the home or default database.
+
+        The names are cached until the connection or the current database
+        changes.
+        """
+
+        if which in self._db_names:
+
+            return self._db_names[which]
 
         try:
 
@@ -438,14 +796,14 @@ class Driver:
 
         except (neo4j_exc.AuthError, neo4j_exc.ServiceUnavailable) as e:
 
-            logger.error(
-                f'No connection to Neo4j server: {printer.error_str(e)}',
-            )
+            _log_error('No connection to Neo4j server', e)
             return
 
         if resp:
 
-            return resp[0]['name']
+            self._db_names[which] = resp[0]['name']
+
+            return self._db_names[which]
 
 
     @property
@@ -477,6 +835,8 @@ class Driver:
             fallback_db: str | tuple[str] | None = None,
             fallback_on: str | set[str] | None = None,
             raise_errors: bool | None = None,
+            autocommit: bool | None = None,
+            stream: bool = False,
             **kwargs,
     ) -> tuple[list[dict] | None, neo4j.work.summary.ResultSummary | None]:
         """
@@ -490,8 +850,13 @@ class Driver:
                 A valid CYPHER query, can include APOC if the APOC
                 plugin is installed in the accessed database.
             db:
-                The DB inside the Neo4j server that should be queried
-                fetch_size (int): the Neo4j fetch size parameter.
+                The DB inside the Neo4j server that should be queried.
+            fetch_size:
+                The Neo4j fetch size parameter: number of records
+                retrieved in one round trip to the server. By default,
+                as all records are read into a list anyway, all of them
+                are retrieved in one round trip; streamed queries use
+                the fetch size from the config.
             write:
                 Indicates whether to address write- or read-servers.
             explain:
@@ -510,6 +875,25 @@ class Driver:
             raise_errors:
                 Raise Neo4j errors instead of only printing them into
                 the log and stdout.
+            autocommit:
+                Run the query in an auto-commit transaction instead of a
+                transaction function. Transaction functions are retried
+                by the driver upon transient errors, but queries which
+                manage their own transactions (``CALL {} IN
+                TRANSACTIONS``, ``USING PERIODIC COMMIT``) can not run
+                in them. By default these queries are recognized by
+                their text, and queries with fallback databases run in
+                auto-commit transactions too, so errors are not retried
+                before trying the fallback databases.
+            stream:
+                Instead of a list, return a generator of the records, each
+                fetched from the server only when iterated, in batches of
+                `fetch_size`. In this case the second element of the
+                returned tuple is the ``neo4j.Result`` object, its
+                ``consume()`` method provides the summary after the
+                records have been iterated. The query runs in an
+                auto-commit transaction, and errors happening while
+                iterating the records are raised to the caller.
             **kwargs:
                 Optional objects used in CYPHER interactive mode,
                 for instance for passing a parameter dictionary.
@@ -536,23 +920,17 @@ class Driver:
                   transaction functions can return values but these
                   should be derived values rather than raw results."
 
-            - use session.run() or individual transactions?
-
-                - From Docs: "Transaction functions are the recommended
-                  form for containing transactional units of work.
-                  When a transaction fails, the driver retry logic is
-                  invoked. For several failure cases, the transaction
-                  can be immediately retried against a different
-                  server. These cases include connection issues,
-                  server role changes (e.g. leadership elections)
-                  and transient errors."
-
-            - use write and read distinctions in calling transactions
-              ("access mode")?
             - use neo4j `@unit_of_work`?
 
         """
 
+        # first thing, as dry runs may generate lots of queries
+        if self._offline:
+
+            logger.info('Offline mode, not running query: `%s`.', query)
+
+            return None, None
+
         if explain:
 
             query = 'EXPLAIN ' + query
@@ -561,50 +939,53 @@ class Driver:
 
             query = 'PROFILE ' + query
 
-        if self.offline:
-
-            logger.info(f'Offline mode, not running query: `{query}`.')
-
-            return None, None
-
-        db = db or self._db_config['db'] or neo4j.DEFAULT_DATABASE
-        fetch_size = fetch_size or self._db_config['fetch_size']
+        db = db or self._database
+        # -1: all records at once, in one round trip
+        fetch_size = fetch_size or (
+            self._db_config['fetch_size'] if stream else -1
+        )
         raise_errors = (
             self._db_config['raise_errors']
                 if raise_errors is None else
             raise_errors
         )
 
-        if self.multi_db:
-            session_args = {
-                'database': db,
-                'fetch_size': fetch_size,
-                'default_access_mode':
-                    neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS,
-            }
-        else:
-            session_args = {
-                'fetch_size': fetch_size,
-                'default_access_mode':
-                    neo4j.WRITE_ACCESS if write else neo4j.READ_ACCESS,
-            }
-
-        try:
+        session_args = {
+            **_SESSION_ARGS[bool(write)],
+            'fetch_size': fetch_size,
+            **self._session_db(db),
+        }
 
-            with self.session(**session_args) as session:
+        fallback_db = tuple(
+            fdb
+            for fdb in _misc.to_tuple(
+                fallback_db or getattr(self, '_fallback_db', ()),
+            )
+            if fdb != db
+        )
+        # with fallback databases, errors should arrive quickly instead of
+        # being retried by the transaction function for up to 30 seconds
+        autocommit = (
+            bool(fallback_db or _AUTOCOMMIT_RE.search(query))
+                if autocommit is None else
+            autocommit
+        )
 
-                res = session.run(query, **kwargs)
+        run = dict(
+            query = query,
+            write = write,
+            autocommit = autocommit,
+            stream = stream,
+            kwargs = kwargs,
+        )
 
-                self._queries['last'] = _query.Query(
-                    query = query,
-                    args = kwargs,
-                )
+        try:
 
-                return res.data(), res.consume()
+            return self._run_query(session_args = session_args, **run)
 
         except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
 
-            fallback_db = fallback_db or getattr(self, '_fallback_db', ())
+            error = e
             fallback_on = _misc.to_set(
                 _misc.if_none(
                     fallback_on,
@@ -614,27 +995,31 @@ class Driver:
 
             if self.match_error(e, fallback_on):
 
-                for fdb in _misc.to_tuple(fallback_db):
+                # retried here, instead of calling `query` again, so the
+                # arguments are not resolved again for each database
+                for fdb in fallback_db:
+
+                    logger.warn(
+                        'Running query against fallback database `%s`.',
+                        fdb,
+                    )
 
-                    if fdb != db:
+                    session_args = {**session_args, **self._session_db(fdb)}
 
-                        logger.warn(
-                            'Running query against fallback '
-                            f'database `{fdb}`.',
-                        )
+                    try:
 
-                        return self.query(
-                            query = query,
-                            db = fdb,
-                            fetch_size = fetch_size,
-                            write = write,
-                            fallback_on = set(),
-                            raise_errors = raise_errors,
-                            **kwargs
+                        return self._run_query(
+                            session_args = session_args,
+                            **run,
                         )
 
-            logger.error(f'Failed to run query: {printer.error_str(e)}')
-            logger.error(f'The error happened with this query: {query}')
+                    except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as fe:
+
+                        error = fe
+
+            _log_error('Failed to run query', error)
+            logger.error('The error happened with this query: %s', query)
+
             log_traceback()
 
             self._queries['last_failed'] = _query.Query(
@@ -642,7 +1027,7 @@ class Driver:
                 args = kwargs,
             )
 
-            if e.__class__.__name__ == 'AuthError':
+            if error.__class__.__name__ == 'AuthError':
 
                 logger.error(
                     'Authentication error, switching to offline mode.',
@@ -651,109 +1036,320 @@ class Driver:
 
             if raise_errors:
 
-                raise
+                raise error
 
             return None, None
 
 
-    def explain(
+    def _run_query(
             self,
-            query,
-            db=None,
-            fetch_size=None,
-            write=True,
-            **kwargs,
-    ):
+            query: str,
+            session_args: dict,
+            write: bool,
+            autocommit: bool,
+            stream: bool,
+            kwargs: dict,
+    ) -> tuple[list[dict] | Iterable[dict], Any]:
         """
-        Explain a query and pretty print the output.
-
-        CAVE: Only handles linear profiles (no branching) as of now.
-        TODO include branching as in profile()
+        Run a query in one database, the errors are handled by `query`.
         """
 
-        logger.info('Explaining a query.')
+        def work(tx):
 
-        data, summary = self.query(
-            query,
-            db,
-            fetch_size,
-            write,
-            explain=True,
-            **kwargs
-        )
+            res = tx.run(query, **kwargs)
 
-        plan = summary.plan
-        printout = printer.pretty(plan)
+            return res.data(), res.consume()
 
-        return plan, printout
+        if stream:
 
+            # a session of its own: other queries in the same session
+            # would make the driver buffer the rest of the records
+            self._ensure_db_once()
+            session = self._track_session(self.driver.session(**session_args))
 
-    def profile(
-            self,
-            query,
-            db=None,
-            fetch_size=None,
-            write=True,
-            **kwargs,
-    ):
-        """
-        Profile a query and pretty print the output.
+            try:
 
-        Args:
-            query (str): a valid Cypher query (see :meth:`query()`)
-            db (str): the DB inside the Neo4j server that should be queried
-            fetch_size (int): the Neo4j fetch size parameter
-            write (bool): indicates whether to address write- or read-
-                servers
-            explain (bool): indicates whether to ``EXPLAIN`` the CYPHER
-                query and return the ResultSummary
-            explain (bool): indicates whether to ``PROFILE`` the CYPHER
-                query and return the ResultSummary
-            **kwargs: optional objects used in CYPHER interactive mode,
-                for instance for passing a parameter dictionary
+                res = session.run(query, **kwargs)
 
-        Returns:
-            2-tuple:
-                - dict: the raw profile returned by the Neo4j bolt driver
-                - list of str: a list of strings ready for printing
-        """
+            except BaseException:
 
-        logger.info('Profiling a query.')
+                self._release_session(session)
+                raise
 
-        data, summary = self.query(
-            query, db, fetch_size, write, profile=True, **kwargs
-        )
+            self._queries['last'] = _query.Query(query = query, args = kwargs)
+            # we can not tell if it changes anything
+            self.invalidate_schema()
 
-        prof = summary.profile
-        exec_time = (
-            summary.result_available_after + summary.result_consumed_after
-        )
+            return self._stream_records(res, session), res
 
-        # get structure
-        # TODO (readability may be better when ordered from top to bottom)
+        session = self._thread_session(**session_args)
 
-        # get print representation
-        header = f'Execution time: {exec_time:n}\n'
-        printout = printer.pretty(prof, [header], indent=0)
+        # until the server is known to be reachable, avoid the retries
+        # of transaction functions, so connection errors come quickly
+        if autocommit or not self._reachable:
 
-        return prof, printout
+            result = work(session)
 
+        else:
 
-    @property
-    def current_db(self) -> str:
-        """
-        Name of the current database.
+            # `execute_read` and `execute_write` are new in v5
+            # of the driver, the old names are deprecated there
+            run_tx = (
+                getattr(session, 'execute_write', None) or
+                session.write_transaction
+                    if write else
+                getattr(session, 'execute_read', None) or
+                session.read_transaction
+            )
+            result = run_tx(work)
 
-        All operations and queries are executed by default on this database.
+        self._queries['last'] = _query.Query(query = query, args = kwargs)
 
-        Returns:
-            Name of a database.
-        """
+        if counters := getattr(result[1], 'counters', None):
 
-        return self._db_config['db'] or self._driver_con_db or self.home_db
+            self._invalidate_by_counters(counters)
 
+        return result
 
-    @current_db.setter
+
+    def _stream_records(
+            self,
+            res: neo4j.Result,
+            session: neo4j.Session,
+    ) -> Iterable[dict]:
+        """
+        Yield the records of a result, close its session at the end.
+
+        The session is closed when the records are exhausted or the
+        generator is closed; if iteration never starts, it is closed by
+        `close`.
+        """
+
+        try:
+
+            for rec in res:
+
+                yield rec.data()
+
+        finally:
+
+            self._release_session(session)
+
+
+    def _invalidate_by_counters(self, counters: neo4j.SummaryCounters):
+        """
+        Discard the cached database properties changed by a query.
+
+        The counters of the query tell what kind of changes happened:
+        e.g. setting properties of existing nodes may add new property
+        keys, but does not change the labels or any of the counts.
+        """
+
+        if counters.contains_system_updates or any(
+            getattr(counters, counter)
+            for counter in _STRUCTURE_COUNTERS
+        ):
+
+            self.invalidate_schema()
+
+        elif counters.properties_set:
+
+            self.invalidate_schema('schema_snapshot')
+
+
+    def batch_query(
+            self,
+            statements: Iterable[str | tuple[str, dict]],
+            db: str | None = None,
+            raise_errors: bool | None = None,
+    ) -> list[list[dict]] | None:
+        """
+        Run multiple queries in one write transaction.
+
+        Saves a transaction for each query. The batch is atomic, which is
+        also the trade-off: one failing query rolls back the transaction,
+        and none of the queries in the batch has an effect. Errors are
+        handled like in :py:meth:`query`, but no fallback databases are
+        attempted.
+
+        Args:
+            statements:
+                The queries: each of them either a string or a tuple of
+                the query and a dict of parameters.
+            db:
+                Name of the database, by default the current one.
+            raise_errors:
+                Raise Neo4j errors instead of only printing them into
+                the log and stdout.
+
+        Returns:
+            The records returned by each query, as lists of dicts;
+            `None` in offline mode or if the transaction failed.
+        """
+
+        if self._offline:
+
+            logger.info('Offline mode, not running batch of queries.')
+
+            return None
+
+        statements = [
+            (st, {}) if isinstance(st, str) else tuple(st)
+            for st in statements
+        ]
+        raise_errors = (
+            self._db_config['raise_errors']
+                if raise_errors is None else
+            raise_errors
+        )
+        session_args = {
+            **_SESSION_ARGS[True],
+            'fetch_size': -1,
+            **self._session_db(db),
+        }
+
+        def work(tx):
+
+            return [
+                tx.run(query, params).data()
+                for query, params in statements
+            ]
+
+        try:
+
+            session = self._thread_session(**session_args)
+
+            if self._reachable:
+
+                # `execute_write` is new in v5 of the driver
+                run_tx = (
+                    getattr(session, 'execute_write', None) or
+                    session.write_transaction
+                )
+                result = run_tx(work)
+
+            else:
+
+                with session.begin_transaction() as tx:
+
+                    result = work(tx)
+                    tx.commit()
+
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
+
+            _log_error('Failed to run batch of queries', e)
+            log_traceback()
+
+            if raise_errors:
+
+                raise
+
+            return None
+
+        # we do not collect the summaries to tell if anything changed
+        self.invalidate_schema()
+
+        return result
+
+
+    def explain(
+            self,
+            query,
+            db=None,
+            fetch_size=None,
+            write=True,
+            **kwargs,
+    ):
+        """
+        Explain a query and pretty print the output.
+
+        CAVE: Only handles linear profiles (no branching) as of now.
+        TODO include branching as in profile()
+        """
+
+        logger.info('Explaining a query.')
+
+        data, summary = self.query(
+            query,
+            db,
+            fetch_size,
+            write,
+            explain=True,
+            **kwargs
+        )
+
+        plan = summary.plan
+        printout = printer.pretty(plan)
+
+        return plan, printout
+
+
+    def profile(
+            self,
+            query,
+            db=None,
+            fetch_size=None,
+            write=True,
+            **kwargs,
+    ):
+        """
+        Profile a query and pretty print the output.
+
+        Args:
+            query (str): a valid Cypher query (see :meth:`query()`)
+            db (str): the DB inside the Neo4j server that should be queried
+            fetch_size (int): the Neo4j fetch size parameter
+            write (bool): indicates whether to address write- or read-
+                servers
+            explain (bool): indicates whether to ``EXPLAIN`` the CYPHER
+                query and return the ResultSummary
+            explain (bool): indicates whether to ``PROFILE`` the CYPHER
+                query and return the ResultSummary
+            **kwargs: optional objects used in CYPHER interactive mode,
+                for instance for passing a parameter dictionary
+
+        Returns:
+            2-tuple:
+                - dict: the raw profile returned by the Neo4j bolt driver
+                - list of str: a list of strings ready for printing
+        """
+
+        logger.info('Profiling a query.')
+
+        data, summary = self.query(
+            query, db, fetch_size, write, profile=True, **kwargs
+        )
+
+        prof = summary.profile
+        exec_time = (
+            summary.result_available_after + summary.result_consumed_after
+        )
+
+        # get structure
+        # TODO (readability may be better when ordered from top to bottom)
+
+        # get print representation
+        header = f'Execution time: {exec_time:n}\n'
+        printout = printer.pretty(prof, [header], indent=0)
+
+        return prof, printout
+
+
+    @property
+    def current_db(self) -> str:
+        """
+        Name of the current database.
+
+        All operations and queries are executed by default on this database.
+
+        Returns:
+            Name of a database.
+        """
+
+        return self._db_config['db'] or self._driver_con_db or self.home_db
+
+
+    @current_db.setter
     def current_db(self, name: str):
         """
         The database currently in use.
@@ -767,25 +1363,92 @@ class Driver:
         self.db_connect()
 
 
+    @property
+    def _database(self) -> str | None:
+        """
+        Database to use in sessions: the configured one or the default.
+
+        Not stored as an attribute, as the configured database is changed
+        at many places, and a copy of it could get outdated.
+        """
+
+        return self._db_config['db'] or _DEFAULT_DATABASE
+
+
+    def _session_db(self, db: str | None = None) -> dict[str, str | None]:
+        """
+        The database argument of sessions, by default the current database.
+
+        Passing the name saves a round trip for each session to look up
+        the default database. Empty if the server supports only one
+        database (see `multi_db`).
+        """
+
+        if self.multi_db is False:
+
+            return {}
+
+        return {'database': db or self._database}
+
+
     @property
     def _driver_con_db(self):
+        """
+        The database of the driver's connection, cached for each driver.
+        """
 
         if not self.driver:
 
             return
 
-        with warnings.catch_warnings():
+        cached_driver, db = getattr(self, '_con_db_cache', (None, None))
 
-            warnings.simplefilter('ignore')
+        if cached_driver is self.driver:
 
-            try:
+            return db
+
+        db = self._verify_con_db()
 
-                driver_con = self.driver.verify_connectivity()
+        if db is not None:
 
-            except neo4j_exc.ServiceUnavailable:
+            self._con_db_cache = (self.driver, db)
 
-                logger.error('Can not access Neo4j server.')
-                return
+        return db
+
+
+    @property
+    def _reachable(self) -> bool:
+        """
+        Whether the server could be contacted, cached for each driver.
+        """
+
+        if getattr(self, '_reachable_driver', None) is self.driver:
+
+            return True
+
+        try:
+
+            self.driver.verify_connectivity()
+
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError):
+
+            return False
+
+        self._reachable_driver = self.driver
+
+        return True
+
+
+    def _verify_con_db(self):
+
+        try:
+
+            driver_con = self.driver.verify_connectivity()
+
+        except neo4j_exc.ServiceUnavailable:
+
+            logger.error('Can not access Neo4j server.')
+            return
 
         if driver_con:
 
@@ -829,16 +1492,48 @@ class Driver:
         """
 
         name = name or self.current_db
+        db = self._databases().get(name)
 
-        query = f'SHOW DATABASES WHERE name = "{name}";'
+        if db:
 
-        with self.fallback():
+            return db.get(field, db)
 
-            resp, summary = self.query(query)
 
-        if resp:
+    def _databases(self) -> dict[str, dict]:
+        """
+        State of all databases, by their names.
+
+        One query provides the data for all calls within a short time
+        window (see `_DATABASES_TTL`), management commands reset it.
+        """
+
+        cached_at, databases = getattr(
+            self,
+            '_databases_cache',
+            (None, None),
+        )
+        now = time.monotonic()
+
+        if cached_at is None or now - cached_at > _DATABASES_TTL:
+
+            with self.fallback():
+
+                resp, summary = self.query('SHOW DATABASES;')
 
-            return resp[0].get(field, resp[0])
+            if resp is None:
+
+                return {}
+
+            databases = {}
+
+            for db in resp:
+
+                # in a cluster there is one record for each server
+                databases.setdefault(db['name'], db)
+
+            self._databases_cache = (now, databases)
+
+        return databases
 
 
     def db_online(self, name: str | None = None):
@@ -917,14 +1612,14 @@ class Driver:
                 The optional parts of the command, following the database name.
         """
 
+        # the name is passed as a parameter, so the query string is the
+        # same for all databases
         self.query(
-            '{} DATABASE {} {};'.format(
-                cmd,
-                name or self.current_db,
-                options or '',
-            ),
+            ' '.join(filter(None, (cmd, 'DATABASE $name', options))) + ';',
             fallback_db = self._get_fallback_db,
+            parameters = {'name': name or self.current_db},
         )
+        self._databases_cache = (None, None)
 
 
     def wipe_db(self):
@@ -932,12 +1627,25 @@ class Driver:
         Delete all contents of the current database.
 
         Used in initialisation, deletes all nodes and edges and drops
-        all indices and constraints.
+        all indices and constraints. The nodes are deleted in batches,
+        each in its own transaction, so the server does not have to
+        hold the whole deletion in memory.
         """
 
-        logger.info(f'Wiping database `{self.current_db}`.')
+        logger.info('Wiping database `%s`.', self.current_db)
+
+        # `IN TRANSACTIONS` is available only from v4.4; if the version
+        # is unknown, we assume a recent server
+        if (self._neo4j_version or (5, 0)) >= (4, 4):
 
-        self.query('MATCH (n) DETACH DELETE n;')
+            self.query(
+                'MATCH (n) CALL { WITH n DETACH DELETE n } '
+                f'IN TRANSACTIONS OF {_WIPE_BATCH_SIZE} ROWS;',
+            )
+
+        else:
+
+            self.query('MATCH (n) DETACH DELETE n;')
 
         self.drop_indices_constraints()
 
@@ -950,15 +1658,30 @@ class Driver:
         not have the sufficient privileges, an exception will be raised.
         """
 
-        if not self.db_exists():
+        self._ensure_pending = False
+        status = self.db_status()
+
+        if not status:
 
-            self.create_db()
+            # a new database is started upon creation, with WAIT the
+            # command returns only when it is online
+            self._manage_db('CREATE', options = 'IF NOT EXISTS WAIT')
 
-        if not self.db_online():
+        elif status != 'online':
 
             self.start_db()
 
 
+    def _ensure_db_once(self):
+        """
+        Call `ensure_db` if it has not been called yet.
+        """
+
+        if self._ensure_pending:
+
+            self.ensure_db()
+
+
     def select_db(self, name: str):
         """
         Set the current database.
@@ -974,6 +1697,9 @@ class Driver:
 
             self._register_current_driver()
             self._db_config['db'] = name
+            self._db_names = {}
+            self._schema_cache = {}
+            self._apoc_state = None
 
             if name in self._drivers:
 
@@ -985,37 +1711,72 @@ class Driver:
 
 
     @property
-    def indices(self) -> list | None:
+    def _neo4j_version_major(self) -> int:
         """
-        List of indices in the current database.
+        Major version of Neo4j, 5 if it can not be detected.
+
+        In the absence of a version, the syntax of the recent versions is
+        used.
         """
 
-        return self._list_indices('indices')
+        return (self._neo4j_version or (5,))[0]
 
 
     @property
-    def constraints(self) -> list | None:
+    def _neo4j_version(self) -> tuple[int, int] | None:
         """
-        List of constraints in the current database.
+        Major and minor version of Neo4j, `None` if it can not be detected.
+
+        Asked from the server once for each driver; if that fails, read
+        from the local ``neo4j-admin``, which is run once in the process.
         """
 
-        return self._list_indices('constraints')
+        cache = getattr(self, '_version_cache', None)
 
+        # a failed detection is cached too, so it is not repeated on
+        # every access: only a new driver triggers detecting again
+        if cache is None or cache[0] is not self.driver:
+
+            version = _n4jversion.Neo4jVersion(driver = self)
+            cache = self._version_cache = (
+                self.driver,
+                None
+                    if version.major is None else
+                (version.major, version.minor),
+            )
+
+        return cache[1]
+
+
+    @property
+    def indices(self) -> list | None:
+        """
+        List of indices in the current database.
+        """
+
+        return self._list_indices('indices')
+
+
+    @property
+    def constraints(self) -> list | None:
+        """
+        List of constraints in the current database.
+        """
+
+        return self._list_indices('constraints')
 
-    def drop_indices_constraints(self):
-        """
-        Drops all indices and constraints in the current database.
+
+    def drop_indices_constraints(self):
+        """
+        Drops all indices and constraints in the current database.
 
         Requires the database to be empty.
         """
 
-        neo4j_version = _n4jversion.Neo4jVersion()
+        self.drop_constraints()
 
-        if neo4j_version.version >= 5:
-            self.drop_constraints()
+        if self._neo4j_version_major < 5:
 
-        else:
-            self.drop_constraints()
             self.drop_indices()
 
 
@@ -1045,29 +1806,38 @@ class Driver:
 
         what_u = self._idx_cstr_synonyms(what)
 
-        neo4j_version = _n4jversion.Neo4jVersion()
+        s = self._thread_session(**self._session_db())
 
-        with self.session() as s:
+        try:
 
-            try:
+            if self._neo4j_version_major >= 5:
+                indices = s.run(f'SHOW {what}')
+            else:
+                indices = s.run(f'CALL db. {what}')
 
-                if neo4j_version.version >= 5:
-                    indices = s.run(f'SHOW {what}')
-                else:
-                    indices = s.run(f'CALL db. {what}')
+            indices = list(indices)
+            n_indices = len(indices)
+            index_names = ', '.join(i['name'] for i in indices)
 
-                indices = list(indices)
-                n_indices = len(indices)
-                index_names = ', '.join(i['name'] for i in indices)
+            def drop(tx, names):
 
-                for idx in indices:
-                    s.run(f'DROP {what_u} `{idx["name"]}` IF EXISTS')
+                for name in names:
 
-                logger.info(f'Dropped {n_indices} indices: {index_names}.')
+                    tx.run(f'DROP {what_u} `{name}` IF EXISTS').consume()
 
-            except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
+            # one transaction instead of a round trip for each index;
+            # `execute_write` is new in v5 of the driver
+            write = (
+                getattr(s, 'execute_write', None) or
+                s.write_transaction
+            )
+            write(drop, [i['name'] for i in indices])
 
-                logger.error(f'Failed to run query: {printer.error_str(e)}')
+            logger.info('Dropped %u indices: %s.', n_indices, index_names)
+
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
+
+            _log_error('Failed to run query', e)
 
 
     def _list_indices(
@@ -1077,361 +1847,910 @@ class Driver:
 
         what_u = self._idx_cstr_synonyms(what)
 
-        with self.session() as s:
+        return self._read_tx(
+            lambda tx: list(tx.run(f'SHOW {what_u.upper()};')),
+        )
 
-            try:
 
-                return list(s.run(f'SHOW {what_u.upper()};'))
+    @staticmethod
+    def _idx_cstr_synonyms(what: str) -> str | None:
 
-            except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
+        what_u = _IDX_CSTR_SYNONYMS.get(what, None)
 
-                logger.error(f'Failed to run query: {printer.error_str(e)}')
+        if not what_u:
 
+            msg = (
+                'Allowed keywords are: "indexes", '
+                f'"indices" or "constraints", not `{what}`.'
+            )
 
-    @staticmethod
-    def _idx_cstr_synonyms(what: str) -> str | None:
+            logger.error(msg)
+
+            raise ValueError(msg)
+
+        return what_u
+
+
+    @property
+    def node_count(self) -> int | None:
+        """
+        Number of nodes in the database.
+
+        Cached like the other database properties (see `_cached`). Read
+        from the statistics of APOC or from the count store of the
+        database, no nodes are scanned.
+        """
+
+        return self._cached(
+            'node_count',
+            lambda: self._count('nodeCount', 'MATCH (n) RETURN COUNT(n);'),
+        )
+
+
+    @property
+    def edge_count(self) -> int | None:
+        """
+        Number of edges in the database.
+
+        Cached like the other database properties (see `_cached`). Read
+        from the statistics of APOC or from the count store of the
+        database, no relationships are scanned.
+        """
+
+        return self._cached(
+            'edge_count',
+            lambda: self._count(
+                'relCount',
+                'MATCH ()-[r]->() RETURN COUNT(r);',
+            ),
+        )
+
+
+    def _count(self, stats_key: str, query: str) -> int | None:
+        """
+        A count from ``apoc.meta.stats``, or by a query if APOC is missing.
+        """
+
+        if stats := self._meta_stats():
+
+            return stats[stats_key]
+
+        return self._read_tx(lambda tx: tx.run(query).single()[0])
+
+
+    @property
+    def user(self) -> str | None:
+        """
+        User for the currently active connection.
+
+        Returns:
+            The name of the user, `None` if no connection or no
+            unencrypted authentication data is available.
+        """
+
+        return self._extract_auth[0]
+
+    @property
+    def passwd(self) -> str | None:
+        """
+        Password for the currently active connection.
+
+        Returns:
+            The name of the user, `None` if no connection or no
+            unencrypted authentication data is available.
+        """
+
+        return self._extract_auth[1]
+
+
+    @property
+    def _extract_auth(self) -> tuple[str | None, str | None]:
+        """
+        Extract authentication data from the Neo4j driver.
+
+        The result is cached until a different driver is assigned to
+        the :py:attr:`driver` attribute.
+        """
+
+        cached_driver, auth = getattr(self, '_auth_cache', (None, None))
+
+        if cached_driver is not self.driver or not self.driver:
+
+            auth = None, None
+
+            if self.driver:
+
+                opener_vars = self._opener_vars
+
+                if 'auth' in opener_vars:
+
+                    auth = opener_vars['auth'].cell_contents
+
+            self._auth_cache = (self.driver, auth)
+
+        return auth
+
+
+    @property
+    def _opener_vars(self) -> dict:
+        """
+        Extract variables from the opener part of the Neo4j driver.
+        """
+
+        return dict(
+            zip(
+                self.driver._pool.opener.__code__.co_freevars,
+                self.driver._pool.opener.__closure__,
+            ),
+        )
+
+
+    def __len__(self):
+        """
+        Number of nodes in the database (see `node_count`).
+        """
+
+        return self.node_count
+
+
+    def __bool__(self):
+        """
+        Whether the object is connected, without contacting the server.
+
+        Without this, truth testing would fall back to `__len__`, which
+        counts the nodes in the database.
+        """
+
+        return bool(self.driver) and not self._offline
+
+
+    @contextlib.contextmanager
+    def use_db(self, name: str):
+        """
+        A context where the default database is set to `name`.
+
+        Args:
+            name:
+                The name of the desired default database.
+        """
+
+        used_previously = self.current_db
+        self.select_db(name = name)
+
+        try:
+
+            yield None
+
+        finally:
+
+            self.select_db(name = used_previously)
+
+
+    @contextlib.contextmanager
+    def fallback(
+            self,
+            db: str | tuple[str] | None = None,
+            on: str | set[str] | None = None,
+    ):
+        """
+        Should running on the default database fail, try a fallback database.
+
+        A cotext that attempts to run queries against a fallback database if
+        running against the default database fails.
+
+        Args:
+            db:
+                Name of one or more fallback database(s).
+            on:
+                Names of the errors when the fallback database should be used.
+        """
+
+        prev = {}
+
+        for var, value in (('db', db), ('on', on)):
+
+            prev[var] = getattr(self, f'_fallback_{var}', None)
+            setattr(
+                self,
+                f'_fallback_{var}',
+                value or self._db_config.get(f'fallback_{var}'),
+            )
+
+        try:
+
+            yield None
+
+        finally:
+
+            for var in ('db', 'on'):
+
+                setattr(self, f'_fallback_{var}', prev[var])
+
+
+    @contextlib.contextmanager
+    def session(self, **kwargs):
+        """
+        Context with a database connection session.
+
+        A context that creates a session and closes it at the end. By
+        default the session uses the current database. As the queries run
+        in the session might change anything, the cached schema and
+        counts are discarded at the end (see `invalidate_schema`).
+
+        Args:
+            Kwargs:
+                Passed to ``neo4j.Neo4jDriver.session``.
+        """
+
+        self._ensure_db_once()
+        session = self.driver.session(**{**self._session_db(), **kwargs})
+
+        try:
+
+            yield session
+
+        finally:
+
+            session.close()
+            self.invalidate_schema()
+
+
+    def _thread_session(self, **kwargs) -> neo4j.Session:
+        """
+        A session reused by the queries of the current thread.
+
+        Sessions are not thread safe, hence each thread has its own
+        sessions, one for each combination of session parameters. Only
+        the thread holds them: when it ends, its sessions are garbage
+        collected, and closed by the neo4j driver.
+
+        Args:
+            Kwargs:
+                Passed to ``neo4j.Neo4jDriver.session``.
+        """
+
+        # all interactions to the server start here
+        self._ensure_db_once()
+        sessions = self._sessions.__dict__.setdefault('sessions', {})
+        key = (self.driver, tuple(sorted(kwargs.items())))
+        session = sessions.get(key)
+
+        if session is None:
+
+            session = sessions[key] = self._track_session(
+                self.driver.session(**kwargs),
+            )
+
+        return session
+
+
+    def _close_sessions(self):
+        """
+        Close the sessions of all threads.
+
+        Sessions of worker threads are closed too, hence this must not be
+        called while other threads are running queries.
+        """
+
+        lock = getattr(self, '_sessions_lock', None)
+
+        if lock is None:
+
+            return
+
+        with lock:
+
+            sessions = list(self._open_sessions)
+            self._open_sessions = weakref.WeakSet()
+            # a new thread local: forget the sessions of every thread
+            self._sessions = threading.local()
+
+        for session in sessions:
+
+            with contextlib.suppress(
+                neo4j_exc.Neo4jError,
+                neo4j_exc.DriverError,
+                OSError,
+            ):
+
+                session.close()
+
+
+    def _track_session(self, session: neo4j.Session) -> neo4j.Session:
+        """
+        Register a session to be closed by `close`.
+        """
+
+        with self._sessions_lock:
+
+            self._open_sessions.add(session)
+
+        return session
+
+
+    def _release_session(self, session: neo4j.Session):
+        """
+        Close a session registered by `_track_session`.
+        """
+
+        with self._sessions_lock:
+
+            self._open_sessions.discard(session)
+
+        session.close()
+
+
+    @property
+    def driver(self) -> neo4j.Driver | None:
+        """
+        The neo4j driver used to connect to the server.
+        """
+
+        return self._driver
+
+
+    @driver.setter
+    def driver(self, driver: neo4j.Driver | None):
+        """
+        Set the neo4j driver; the sessions of the previous one are closed.
+        """
+
+        if getattr(self, '_driver', None) is not driver:
+
+            self._close_sessions()
+
+        self._driver = driver
+
+
+    def __enter__(self):
+
+        self._context_session = self.session()
+
+        return self._context_session
+
+
+    def __exit__(self, *exc):
+
+        if hasattr(self, '_context_session'):
+
+            self._context_session.close()
+            delattr(self, '_context_session')
+
+
+    def __repr__(self):
+
+        return '<{} {}>'.format(
+            self.__class__.__name__,
+            self._connection_str if self.driver else '[offline]',
+        )
+
+
+    @property
+    def _connection_str(self):
+
+        return '%s://%s:%u/%s' % (
+            _CAMEL_RE.split(self.driver.__class__.__name__)[0].lower(),
+            self.driver._pool.address[0] if self.driver else 'unknown',
+            self.driver._pool.address[1] if self.driver else 0,
+            self.user or 'unknown',
+        )
+
+
+    @property
+    def node_labels(self) -> list[str]:
+        """
+        Node labels defined in the database.
+
+        Presence of a label does not guarantee any instance of it exists in
+        the database.
+        """
+
+        return self._schema('labels')
+
+
+    @property
+    def label_counts(self):
+        """
+        Count the nodes by labels.
 
-        what_s = {
-            'indexes': 'INDEX',
-            'indices': 'INDEX',
-            'constraints': 'CONSTRAINT',
-        }
+        Nodes with multiple labels are counted for each of their labels.
+        The counts are read from the statistics of APOC, if available,
+        otherwise from the count store of the database, no nodes are
+        scanned.
+        """
 
-        what_u = what_s.get(what, None)
+        return self._cached('label_counts', self._label_counts)
 
-        if not what_u:
 
-            msg = (
-                'Allowed keywords are: "indexes", '
-                f'"indices" or "constraints", not `{what}`.'
-            )
+    def _label_counts(self) -> dict[str, int]:
 
-            logger.log_error(msg)
+        if stats := self._meta_stats():
 
-            raise ValueError(msg)
+            return {
+                sys.intern(k): v
+                for k, v in stats['labels'].items()
+                if v
+            }
 
-        return what_u
+        return self._store_counts('db.labels', '(:{})')
 
 
     @property
-    def node_count(self) -> int | None:
+    def rel_types(self) -> list[str]:
         """
-        Number of nodes in the database.
+        Relationship types defined in the database.
         """
 
-        res, summary = self.query('MATCH (n) RETURN COUNT(n) AS count;')
-
-        return res[0]['count'] if res else None
+        return self._schema('rel_types')
 
 
     @property
-    def edge_count(self) -> int | None:
+    def rel_type_counts(self):
         """
-        Number of edges in the database.
+        Count the relationships by types.
+
+        The counts are read from the statistics of APOC, if available,
+        otherwise from the count store of the database, no relationships
+        are scanned.
         """
 
-        res, summary = self.query('MATCH ()-[r]->() RETURN COUNT(r) AS count;')
+        return self._cached('rel_type_counts', self._rel_type_counts)
 
-        return res[0]['count'] if res else None
 
+    def _rel_type_counts(self) -> dict[str, int]:
 
-    @property
-    def user(self) -> str | None:
+        if stats := self._meta_stats():
+
+            return {
+                sys.intern(k): v
+                for k, v in stats['relTypesCount'].items()
+                if v
+            }
+
+        return self._store_counts('db.relationshipTypes', '()-[:{}]->()')
+
+
+    def _store_counts(self, procedure: str, pattern: str) -> dict[str, int]:
         """
-        User for the currently active connection.
+        Count nodes by labels or relationships by types, without APOC.
 
-        Returns:
-            The name of the user, `None` if no connection or no
-            unencrypted authentication data is available.
+        One ``MATCH`` for each label or type, combined by ``UNION ALL``.
+        The counts are aggregated without grouping keys and named only
+        afterwards, so the planner reads them from the count store of the
+        database, no nodes or relationships are scanned.
+
+        Args:
+            procedure:
+                The procedure listing the labels or types.
+            pattern:
+                The pattern to count, with ``{}`` in place of the label
+                or type.
         """
 
-        return self._extract_auth[0]
+        return self._read_tx(
+            lambda tx: _store_counts(tx, procedure, pattern),
+            default = {},
+        )
 
-    @property
-    def passwd(self) -> str | None:
+
+    def _meta_stats(self) -> dict | None:
         """
-        Password for the currently active connection.
+        Node and relationship counts from ``apoc.meta.stats``.
 
         Returns:
-            The name of the user, `None` if no connection or no
-            unencrypted authentication data is available.
+            A dict with the keys `labels`, `relTypesCount`, `nodeCount`
+            and `relCount`, or `None` if APOC is not available or the
+            query failed.
         """
 
-        return self._extract_auth[1]
+        def meta_stats():
+
+            if not self.has_apoc:
+
+                return None
+
+            return self._read_tx(_meta_stats)
+
+        return self._cached('meta_stats', meta_stats)
 
 
     @property
-    def _extract_auth(self) -> tuple[str | None, str | None]:
+    def prop_keys(self):
         """
-        Extract authentication data from the Neo4j driver.
+        Property keys defined in the database.
         """
 
-        auth = None, None
+        return self._schema('prop_keys')
 
-        if self.driver:
 
-            opener_vars = self._opener_vars
+    def schema_snapshot(self) -> dict[str, list[str] | str | None]:
+        """
+        Labels, relationship types, property keys and APOC version.
 
-            if 'auth' in opener_vars:
+        The first three are retrieved in one read transaction, and cached
+        like the other database properties (see `_cached`).
 
-                auth = opener_vars['auth'].cell_contents
+        Returns:
+            A dict with the keys `labels`, `rel_types`, `prop_keys` and
+            `apoc_version`. The lists are empty if the database is not
+            accessible.
+        """
 
-        return auth
+        snapshot = self._cached('schema_snapshot', self._schema_snapshot)
+        snapshot['apoc_version'] = self.apoc_version
 
+        return snapshot
 
-    @property
-    def _opener_vars(self) -> dict:
+
+    async def schema_snapshot_async(self) -> dict[str, list[str] | str | None]:
         """
-        Extract variables from the opener part of the Neo4j driver.
+        The same as `schema_snapshot`, for use in asyncio applications.
+
+        The schema transaction and the APOC probe run concurrently, in
+        worker threads, each with its own session, so the event loop is
+        not blocked.
         """
 
-        return dict(
-            zip(
-                self.driver._pool.opener.__code__.co_freevars,
-                self.driver._pool.opener.__closure__,
+        snapshot, apoc_version = await asyncio.gather(
+            asyncio.to_thread(
+                self._cached,
+                'schema_snapshot',
+                self._schema_snapshot,
             ),
+            asyncio.to_thread(lambda: self.apoc_version),
         )
+        snapshot['apoc_version'] = apoc_version
 
+        return snapshot
 
-    def __len__(self):
 
-        return self.node_count
+    def _schema(self, key: str) -> list[str]:
 
+        return self._cached('schema_snapshot', self._schema_snapshot)[key]
 
-    @contextlib.contextmanager
-    def use_db(self, name: str):
+
+    def _schema_snapshot(self) -> dict[str, list[str]]:
+
+        return self._read_tx(
+            _schema_snapshot,
+            default = {key: [] for key in _SCHEMA_QUERIES},
+        )
+
+
+    def refresh_metadata(self) -> dict[str, Any]:
         """
-        A context where the default database is set to `name`.
+        Retrieve all the cached database properties in one transaction.
 
-        Args:
-            name:
-                The name of the desired default database.
+        Labels, relationship types, property keys and all the counts are
+        queried in a single read transaction, instead of one for each
+        property, and stored in the cache (see `_cached`).
+
+        Returns:
+            A dict with the keys of `schema_snapshot`, and the counts:
+            `label_counts`, `rel_type_counts`, `node_count` and
+            `edge_count`. Empty if the database is not accessible.
         """
 
-        used_previously = self.current_db
-        self.select_db(name = name)
+        self.invalidate_schema()
+        # probed separately: the failing call would abort the transaction
+        apoc_version = self.apoc_version
 
-        try:
+        def work(tx):
 
-            yield None
+            meta = {'schema_snapshot': _schema_snapshot(tx)}
 
-        finally:
+            if apoc_version:
 
-            self.select_db(name = used_previously)
+                meta['meta_stats'] = _meta_stats(tx)
 
+            else:
 
-    @contextlib.contextmanager
-    def fallback(
+                meta.update(
+                    label_counts = _store_counts(tx, 'db.labels', '(:{})'),
+                    rel_type_counts = _store_counts(
+                        tx,
+                        'db.relationshipTypes',
+                        '()-[:{}]->()',
+                    ),
+                    node_count = tx.run(
+                        'MATCH (n) RETURN COUNT(n);',
+                    ).single()[0],
+                    edge_count = tx.run(
+                        'MATCH ()-[r]->() RETURN COUNT(r);',
+                    ).single()[0],
+                )
+
+            return meta
+
+        meta = self._read_tx(work)
+
+        if not meta:
+
+            return {}
+
+        now = time.monotonic()
+        self._schema_cache.update((k, (now, v)) for k, v in meta.items())
+
+        return {
+            **self.schema_snapshot(),
+            'label_counts': self.label_counts,
+            'rel_type_counts': self.rel_type_counts,
+            'node_count': self.node_count,
+            'edge_count': self.edge_count,
+        }
+
+
+    def _read_tx(
             self,
-            db: str | tuple[str] | None = None,
-            on: str | set[str] | None = None,
+            work: Callable,
+            default: Any = None,
+            db: str | None = None,
     ):
         """
-        Should running on the default database fail, try a fallback database.
+        Run a function in a read transaction with the session of this thread.
 
-        A cotext that attempts to run queries against a fallback database if
-        running against the default database fails.
+        The function should consume the records while iterating the
+        results, so they are processed as they arrive, without building
+        intermediate lists.
 
         Args:
+            work:
+                A transaction function, its only argument is the
+                transaction.
+            default:
+                Returned in offline mode or if the transaction fails.
             db:
-                Name of one or more fallback database(s).
-            on:
-                Names of the errors when the fallback database should be used.
-        """
+                Name of the database, by default the current one.
 
-        prev = {}
+        Returns:
+            The value returned by `work`.
+        """
 
-        for var in ('db', 'on'):
+        if self.offline or not self.driver:
 
-            prev[var] = getattr(self, f'_fallback_{var}', None)
-            setattr(
-                self,
-                f'_fallback_{var}',
-                locals()[var] or self._db_config.get(f'fallback_{var}'),
-            )
+            return default
 
         try:
 
-            yield None
+            return self._run_read_tx(work, db = db)
 
-        finally:
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
 
-            for var in ('db', 'on'):
+            _log_error('Failed to run query', e)
 
-                setattr(self, f'_fallback_{var}', prev[var])
+        return default
 
 
-    @contextlib.contextmanager
-    def session(self, **kwargs):
-        """
-        Context with a database connection session.
+    def _run_read_tx(self, work: Callable, db: str | None = None):
+
+        session_args = {
+            **_SESSION_ARGS[False],
+            'fetch_size': self._db_config['fetch_size'],
+            **self._session_db(db),
+        }
+        session = self._thread_session(**session_args)
 
-        A context that creates a session and closes it at the end.
+        if not self._reachable:
 
-        Args:
-            Kwargs:
-                Passed to ``neo4j.Neo4jDriver.session``.
+            # fail quickly instead of retrying, as in `query`
+            return work(session)
+
+        # `execute_read` is new in v5 of the driver
+        run_tx = (
+            getattr(session, 'execute_read', None) or
+            session.read_transaction
+        )
+
+        return run_tx(work)
+
+
+    @property
+    def apoc_version(self) -> str | None:
         """
+        Version of the APOC plugin available in the current database.
 
-        session = self.driver.session(**kwargs)
+        The server is asked only once for each connection, see
+        `reset_apoc_cache`.
+        """
 
-        try:
+        if self._apoc_state and self._apoc_state[0] is self.driver:
 
-            yield session
+            return self._apoc_state[1]
 
-        finally:
+        probed, version = self._probe_apoc()
 
-            session.close()
+        if probed:
 
+            self._apoc_state = (self.driver, version)
 
-    def __enter__(self):
+        return version
 
-        self._context_session = self.session()
 
-        return self._context_session
+    def _probe_apoc(self) -> tuple[bool, str | None]:
+        """
+        Query the APOC version.
 
+        Returns:
+            Whether the server could be asked, and the version, `None` if
+            APOC is not available.
+        """
 
-    def __exit__(self, *exc):
+        if self.offline or not self.driver:
 
-        if hasattr(self, '_context_session'):
+            return False, None
 
-            self._context_session.close()
-            delattr(self, '_context_session')
+        try:
 
+            session = self._thread_session(**self._session_db())
+            record = session.run('RETURN apoc.version() AS output;').single()
 
-    def __repr__(self):
+            return True, None if record is None else record.value('output')
 
-        return '<{} {}>'.format(
-            self.__class__.__name__,
-            self._connection_str if self.driver else '[offline]',
-        )
+        except neo4j_exc.ClientError:
 
+            return True, None
 
-    @property
-    def _connection_str(self):
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
 
-        return '%s://%s:%u/%s' % (
-            re.split(
-                r'(?<=[a-z])(?=[A-Z])',
-                self.driver.__class__.__name__,
-            )[0].lower(),
-            self.driver._pool.address[0] if self.driver else 'unknown',
-            self.driver._pool.address[1] if self.driver else 0,
-            self.user or 'unknown',
-        )
+            _log_error('Failed to run query', e)
 
+            return False, None
 
-    @property
-    def node_labels(self) -> list[str]:
+
+    def reset_apoc_cache(self):
         """
-        Node labels defined in the database.
+        Forget the APOC version, so it is queried again at the next access.
 
-        Presence of a label does not guarantee any instance of it exists in
-        the database.
+        Necessary only if APOC is installed or removed while connected.
         """
 
-        return [
-            i['label']
-            for i in (self.query('CALL db.labels')[0] or [])
-        ]
+        self._apoc_state = None
 
 
     @property
-    def label_counts(self):
+    def has_apoc(self) -> bool:
         """
-        Count the nodes by labels.
+        Tells if APOC is available in the current database.
         """
 
-        return {
-                r['LABELS(n)'][0]:
-                r['COUNT(*)']
-            for r in
-            self.query(
-                'MATCH (n) RETURN DISTINCT LABELS(n), COUNT(*);',
-            )[0] or
-            []
-        }
+        return bool(self.apoc_version)
 
 
-    @property
-    def rel_types(self) -> list[str]:
+    def _cached(self, key: str, fn: Callable, ttl: float = _SCHEMA_TTL):
         """
-        Relationship types defined in the database.
+        Reuse the value of a database property for `ttl` seconds.
+
+        Args:
+            key:
+                Name of the property.
+            fn:
+                Function to retrieve the value of the property.
+            ttl:
+                Maximum age of the cached value in seconds.
+
+        Returns:
+            A copy of the value, so it can be modified by the caller.
         """
 
-        return [
-            i['relationshipType']
-            for i in (self.query('CALL db.relationshipTypes')[0] or [])
-        ]
+        now = time.monotonic()
+        cached_at, value = self._schema_cache.get(key, (None, None))
 
+        if cached_at is None or now - cached_at > ttl:
 
-    @property
-    def rel_type_counts(self):
-        """
-        Count the relationships by types.
-        """
+            value = fn()
 
-        return {
-                r['TYPE(r)']:
-                r['COUNT(*)']
-            for r in
-            self.query(
-                'MATCH ()-[r]->() RETURN DISTINCT TYPE(r), COUNT(*);',
-            )[0] or
-            []
-        }
+            if value is not None:
 
+                # `None` means failure, next time we try again
+                self._schema_cache[key] = (now, value)
 
-    @property
-    def prop_keys(self):
+        return copy.deepcopy(value)
+
+
+    def invalidate_schema(self, keys: str | Iterable[str] | None = None):
         """
-        Property keys defined in the database.
+        Discard the cached labels, types and counts.
+
+        Queries run by this object discard them automatically if they
+        change the database, and so does leaving the `session` context.
+        Changes done by other clients, or through sessions of the neo4j
+        driver obtained otherwise, show up only after `_SCHEMA_TTL`
+        seconds, or after calling this method.
+
+        Args:
+            keys:
+                Names of the properties to discard, by default all of them.
         """
 
-        return [
-            i['propertyKey']
-            for i in (self.query('CALL db.propertyKeys')[0] or [])
-        ]
+        if keys is None:
 
+            self._schema_cache.clear()
 
-    @property
-    def apoc_version(self) -> str | None:
+        else:
+
+            for key in _misc.to_list(keys):
+
+                self._schema_cache.pop(key, None)
+
+
+    def write_config(
+            self,
+            path: str = CONFIG_FILES.__args__[0],
+            format: Literal['yaml', 'json'] | None = None,
+    ):
         """
-        Version of the APOC plugin available in the current database.
+        Write the current config into file.
+
+        The file is replaced atomically: readers see either the old or the
+        new contents, never a partially written file.
+
+        Args:
+            path:
+                Path to the output file.
+            format:
+                Write YAML or JSON. JSON is much faster to write, and, as
+                it is valid YAML, it can be read by `read_config`. By
+                default JSON is written if the file name ends with
+                ``.json``, otherwise YAML.
         """
 
-        db = self._db_config['db'] or neo4j.DEFAULT_DATABASE
+        format = format or (
+            'json' if os.fspath(path).endswith('.json') else 'yaml'
+        )
+
+        if format == 'json':
+
+            data = json.dumps(
+                self._db_config,
+                indent = 2,
+                default = _json_default,
+            ).encode('utf-8')
+
+        else:
+
+            import yaml
+
+            # libyaml based dumper, if PyYAML is built with it
+            dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+            data = yaml.dump(self._db_config, Dumper = dumper).encode('utf-8')
 
         try:
 
-            with self.session(database = db) as session:
+            # the config contains the password: keep the permissions of
+            # the file we replace, a new file is readable only by the user
+            mode = stat.S_IMODE(os.stat(path).st_mode)
 
-                res = session.run('RETURN apoc.version() AS output;')
+        except FileNotFoundError:
 
-                return res.data()[0]['output']
+            mode = 0o600
 
-        except neo4j_exc.ClientError:
+        # a unique name, so concurrent writers do not clobber each other
+        fd, tmp_path = tempfile.mkstemp(
+            dir = os.path.dirname(os.path.abspath(path)),
+            prefix = f'.{os.path.basename(path)}.',
+            suffix = '.tmp',
+        )
 
-            return None
+        try:
 
+            with os.fdopen(fd, 'wb') as fp:
 
-    @property
-    def has_apoc(self) -> bool:
-        """
-        Tells if APOC is available in the current database.
-        """
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
 
-        return bool(self.apoc_version)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+            # the new file might take precedence over the one found before
+            _CONFIG_FILE_CACHE.clear()
 
+        except BaseException:
 
-    def write_config(self, path: str = CONFIG_FILES.__args__[0]):
-        """
-        Write the current config into file.
-        """
+            with contextlib.suppress(OSError):
 
-        with open(path, 'w') as fp:
+                os.remove(tmp_path)
 
-            yaml.safe_dump(self._db_config, fp)
+            raise
 
 
     @property
@@ -1498,7 +2817,11 @@ class Driver:
             db_passwd:
                 Password of the Neo4j user.
             fetch_size:
-                Optional; the fetch size to use in database transactions.
+                Optional; the fetch size to use in database transactions:
+                the number of records retrieved in one round trip to the
+                server. Applies to streamed queries and to the
+                properties read from the database; queries returning
+                lists retrieve all records at once.
             raise_errors:
                 Raise the errors instead of turning them into log messages
                 and returning `None`.
@@ -1514,16 +2837,18 @@ class Driver:
 
         try:
 
-            for k, current in self._db_config.items():
-
-                self._db_config = {
-                    k: _misc.if_none(
-                        locals().get(k, None),
-                        current,
-                        DEFAULT_CONFIG[k],
-                    )
-                    for k, current in self._db_config.items()
-                }
+            args = {
+                'db': db_name,
+                'uri': db_uri,
+                'user': db_user,
+                'passwd': db_passwd,
+                'fetch_size': fetch_size,
+                'raise_errors': raise_errors,
+            }
+            self._db_config.update(
+                (k, v) for k, v in args.items() if v is not None
+            )
+            self._config_from_defaults()
 
             self._config_file = self._config_file or config
 
@@ -1533,7 +2858,7 @@ class Driver:
 
         except Exception as e:
 
-            logger.error(f'Failed to connect: {printer.error_str(e)}')
+            _log_error('Failed to connect', e)
             self._offline = True
 
         if wipe:
@@ -1560,30 +2885,13 @@ class Driver:
             listed in errors.
         """
 
-        def str_to_exc(e):
-
-            return (
-                e.__class__
-                    if isinstance(e, Exception) else
-                getattr(builtins, e, getattr(neo4j_exc, e, e))
-                    if isinstance(e, str) else
-                e
-            )
-
-
-        error = str_to_exc(error)
-        errors = {str_to_exc(e) for e in _misc.to_set(errors)}
+        error = _str_to_exc(error)
+        errors = _misc.to_set(errors)
 
         return (
-            error in errors or
-            (
-                isinstance(error, type) and
-                any(
-                    issubclass(error, e)
-                    for e in errors
-                    if isinstance(e, type)
-                )
-            )
+            isinstance(error, type) and
+            issubclass(error, _exc_classes(frozenset(errors))) or
+            error in errors
         )
 
 
@@ -19,22 +19,127 @@ from datetime import datetime
 import os
 import sys
 import pydoc
+import shlex
+import shutil
 import logging
 import tempfile
 import itertools
 import traceback
+import subprocess
+import collections
 
 import colorlog
 
 from ._metadata import __version__
 
 
+class _LazyFileHandler(logging.FileHandler):
+    """
+    Log file handler which creates the file only when necessary.
+
+    Records are kept in memory until one of at least `flush_level` level
+    arrives, or the log is browsed by `log`. From then on the records
+    are written to the file directly. Of the records in memory only the
+    last `capacity` are kept. If none of these happens, no file is ever
+    created: the records in memory are discarded at closing.
+    """
+
+    def __init__(
+            self,
+            filename: str,
+            capacity: int = 1000,
+            flush_level: int = logging.WARNING,
+    ):
+
+        super().__init__(filename, delay = True)
+        self.flush_level = flush_level
+        self.buffer = collections.deque(maxlen = capacity)
+
+
+    def _open(self):
+
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok = True)
+
+        return super()._open()
+
+
+    def emit(self, record: logging.LogRecord):
+
+        if self.stream is None and record.levelno < self.flush_level:
+
+            self.buffer.append(record)
+
+            return
+
+        self._write_buffer()
+        super().emit(record)
+
+
+    def _write_buffer(self):
+
+        buffer, self.buffer = self.buffer, collections.deque(
+            maxlen = self.buffer.maxlen,
+        )
+
+        for record in buffer:
+
+            super().emit(record)
+
+
+    def write_out(self):
+        """
+        Create the file if necessary, and write the records in memory.
+        """
+
+        self.acquire()
+
+        try:
+
+            self._write_buffer()
+
+            if self.stream is None:
+
+                self.stream = self._open()
+
+            super().flush()
+
+        finally:
+
+            self.release()
+
+
+    def close(self):
+
+        # the file has not been created: nothing important was logged
+        self.buffer.clear()
+        super().close()
+
+
+class _ConsoleFormatter(colorlog.ColoredFormatter):
+    """
+    Colored formatter with the function and level names in brackets.
+
+    The fields are added only to the records formatted for the console,
+    the records of other loggers are not affected.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+
+        record.func_in_brackets = '%-30s' % (
+            f'[{record.name}.{record.funcName}]'
+        )
+        record.level_in_brackets = '%-10s' % f'[{record.levelname}]'
+
+        return super().format(record)
+
+
 def get_logger(name: str = 'neo4ju') -> logging.Logger:
     """
     Access the module logger, create a new one if does not exist yet.
 
     The file handler creates a log file named after the current date and
-    time. Levels to output to file and console can be set here.
+    time, when the first warning is logged, or the log is browsed.
+    Levels to output to file and console can be set here.
 
     Args:
         name:
@@ -54,17 +159,16 @@ def get_logger(name: str = 'neo4ju') -> logging.Logger:
         date_time = now.strftime('%Y%m%d-%H%M%S')
 
         logdir = os.path.join(tempfile.gettempdir(), 'neo4j-utils-log')
-        os.makedirs(logdir, exist_ok=True)
         logfile = os.path.join(logdir, f'neo4j-utils-{date_time}.log')
 
-        file_handler = logging.FileHandler(logfile)
+        file_handler = _LazyFileHandler(logfile)
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(file_formatter)
 
         stdout_handler = colorlog.StreamHandler()
         stdout_handler.setLevel(logging.WARN)
         stdout_handler.setFormatter(
-            colorlog.ColoredFormatter(
+            _ConsoleFormatter(
                 fmt = (
                     '%(log_color)s'
                     '[%(asctime)s.%(msecs)-3d] '
@@ -76,22 +180,6 @@ def get_logger(name: str = 'neo4ju') -> logging.Logger:
             ),
         )
 
-        _logfactory = logging.getLogRecordFactory()
-
-
-        def _logfactory_patched(*args, **kwargs):
-
-            record = _logfactory(*args, **kwargs)
-            record.func_in_brackets = f'[{record.name}.{record.funcName}]'
-            record.func_in_brackets = '%-30s' % record.func_in_brackets
-            record.level_in_brackets = '[%s]' % record.levelname
-            record.level_in_brackets = '%-10s' % record.level_in_brackets
-
-            return record
-
-
-        logging.setLogRecordFactory(_logfactory_patched)
-
         logger = logging.getLogger(name)
         logger.addHandler(file_handler)
         logger.addHandler(stdout_handler)
@@ -115,11 +203,23 @@ def logfile() -> str:
 def log():
     """
     Browse the log file.
+
+    If a pager program is available, it reads the file itself, so the log
+    is not loaded into memory at once.
     """
 
-    with open(logfile()) as fp:
+    get_logger().handlers[0].write_out()
+    pager = os.environ.get('PAGER') or shutil.which('less')
+
+    if pager and sys.stdin.isatty() and sys.stdout.isatty():
+
+        subprocess.call([*shlex.split(pager), logfile()])
 
-        pydoc.pager(fp.read())
+    else:
+
+        with open(logfile()) as fp:
+
+            pydoc.pager(fp.read())
 
 
 def log_traceback():
@@ -127,6 +227,11 @@ def log_traceback():
     Includes the last traceback into the log.
     """
 
+    if not logger.isEnabledFor(logging.ERROR):
+
+        # formatting the stack is costly, skip it if it won't be logged
+        return
+
     exc_type, exc_value, exc_traceback = sys.exc_info()
 
     if exc_type is not None:
@@ -138,33 +243,31 @@ def log_traceback():
 
         stack = traceback.extract_stack()[:-1]
 
-    trc_head = 'Traceback (most recent call last):\n'
+    trc_head = 'Traceback (most recent call last):'
     trc_lines = list(
-        itertools.chain(
-            *(
-                stack_level.strip('\n').split('\n')
-                for stack_level in traceback.format_list(stack)
-            )
+        itertools.chain.from_iterable(
+            stack_level.splitlines()
+            for stack_level in traceback.format_list(stack)
         ),
     )
 
     if exc_type is not None:
 
-        trc_lines.extend(
-            ('  %s' % traceback.format_exc().lstrip(trc_head)).split('\n'),
-        )
-
-    stack_top = 0
-
-    for i, line in enumerate(trc_lines):
-
-        if line.strip().endswith('<module>'):
-
-            stack_top = i
+        # without the header line
+        trc_lines.extend(traceback.format_exc().splitlines()[1:])
 
+    # start from the last module level frame
+    stack_top = next(
+        (
+            i
+            for i in range(len(trc_lines) - 1, -1, -1)
+            if trc_lines[i].strip().endswith('<module>')
+        ),
+        0,
+    )
     trc_lines = trc_lines[stack_top:]
 
-    logger.error(trc_head.strip())
+    logger.error(trc_head)
 
     for traceline in trc_lines:
 
@@ -43,18 +43,20 @@ def if_none(*values) -> Any:
     Use the first item in from ``values`` that is not ``None``.
     """
 
-    for v in values:
-
-        if v is not None:
-
-            return v
+    return next((v for v in values if v is not None), None)
 
 
 def to_list(value: Any) -> list:
     """
     Ensures that ``value`` is a list.
+
+    Lists are returned as they are, not copied.
     """
 
+    if type(value) is list:
+
+        return value
+
     if isinstance(value, LIST_LIKE):
 
         value = list(value)
@@ -75,12 +77,22 @@ def to_tuple(value: Any) -> tuple:
     Ensures that ``value`` is a tuple.
     """
 
-    return tuple(to_list(value))
+    if type(value) is tuple:
+
+        return value
+
+    return tuple(value if isinstance(value, LIST_LIKE) else to_list(value))
 
 
 def to_set(value: Any) -> set:
     """
     Ensures that ``value`` is a set.
+
+    Sets are returned as they are, not copied.
     """
 
-    return set(to_list(value))
+    if type(value) is set:
+
+        return value
+
+    return set(value if isinstance(value, LIST_LIKE) else to_list(value))
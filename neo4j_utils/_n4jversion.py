@@ -1,36 +1,97 @@
+from __future__ import annotations
+
 import re
+import functools
 import subprocess
 
+import neo4j.exceptions as neo4j_exc
+
 from neo4j_utils._logger import logger
 
 __all__ = ['Neo4jVersion']
 
+_SEMVER_RE = re.compile(r'(\d+\.\d+\.\d+)')
+
+
+@functools.lru_cache(maxsize = 1)
+def _neo4j_admin_version() -> str | None:
+    """
+    Output of ``neo4j-admin --version``, run only once in the process.
+
+    A failure is cached too: `None` if the command could not be run.
+    """
+
+    cmd = ['neo4j-admin', '--version']
+
+    try:
+
+        return subprocess.check_output(cmd, timeout = 5).decode().strip()
+
+    except (subprocess.SubprocessError, OSError) as e:
+
+        logger.warning(f'Error running neo4j-admin: {e}')
+
+
+def _components_version(tx) -> str | None:
+    """
+    Version of the server from ``dbms.components``: a transaction function.
+    """
+
+    record = tx.run(
+        'CALL dbms.components() YIELD versions '
+        'RETURN versions[0] AS version;',
+    ).single()
+
+    return record[0] if record else None
+
 
 class Neo4jVersion:
     """
     Provides version information for Neo4j.
     """
 
-    major: int | None
+    major: int | None = None
+    minor: int | None = None
+
+    def __init__(self, driver = None):
+        """
+        Get the neo4j version from the server or the neo4j-admin command.
 
-    def __init__(self):
-        """Get the neo4j version from the neo4j-admin command."""
+        Args:
+            driver:
+                A `neo4j_utils.Driver`: if provided, the server is asked
+                first, and neo4j-admin is run only if that fails.
+        """
         try:
-            cmd = ['neo4j-admin', '--version']
-            output = subprocess.check_output(cmd).decode().strip()
-            version_match = re.search(r'(\d+\.\d+\.\d+)', output)
+            output = (
+                driver is not None and self._server_version(driver) or
+                _neo4j_admin_version()
+            )
+            if output is None:
+                return
+            version_match = _SEMVER_RE.search(output)
             if version_match:
-                self.major = int(version_match.group(1).split('.')[0])
+                self.major, self.minor = map(
+                    int,
+                    version_match.group(1).split('.')[:2],
+                )
             else:
                 logger.warning(
                     f'Unable to parse Neo4j version from command '
                     f'output: {output}',
                 )
-        except subprocess.CalledProcessError as e:
-            logger.warning(f'Error running neo4j-admin: {e}')
+        except (neo4j_exc.Neo4jError, neo4j_exc.DriverError) as e:
+            logger.warning(f'Error asking the server for its version: {e}')
         except (ValueError, IndexError) as e:
             logger.warning(f'Error detecting Neo4j version: {e}')
 
+    @staticmethod
+    def _server_version(driver) -> str | None:
+        """Version of the server, from ``dbms.components``."""
+        # not by `query`, which would raise or log errors depending on
+        # the settings, and replace the last query of the user
+        return driver._read_tx(_components_version)
+
     @property
     def version(self):
         """Return the neo4j major version number."""
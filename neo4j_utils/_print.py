@@ -15,11 +15,28 @@ Pretty printing.
 
 from ._logger import logger
 
-logger.debug(f'Loading module {__name__.strip("_")}.')
-
-from typing import Optional
-
-__all__ = ['bcolors', 'dict_str', 'error_str', 'pretty']
+logger.debug('Loading module %s.', __name__.strip('_'))
+
+from typing import TextIO, Iterator, Optional
+import io
+import sys
+
+__all__ = [
+    'bcolors',
+    'dict_str',
+    'error_str',
+    'pretty',
+    'pretty_print',
+    'pretty_str',
+    'pretty_to',
+]
+
+# keys of the plan nodes handled apart from the rest
+_NOT_LISTED = frozenset(('operatorType', 'children'))
+# both are there for some reason, sometimes both in the same process
+_TIME_KEYS = frozenset(('Time', 'time'))
+# times are printed with spaces as thousands separators
+_THOUSANDS_SEP = str.maketrans(',', ' ')
 
 
 class bcolors:
@@ -34,6 +51,92 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
+_STEP_PREFIX = f'{bcolors.OKBLUE}Step: '
+_STEP_SUFFIX = f' {bcolors.ENDC}'
+
+
+def _pretty_lines(d, indent: int = 0) -> Iterator[str]:
+    """
+    Yield the lines of the pretty format of a Neo4j profile dict.
+    """
+
+    step, step_end = _STEP_PREFIX, _STEP_SUFFIX
+    warning, endc = bcolors.WARNING, bcolors.ENDC
+    # an explicit stack instead of recursion, so deep plans do not
+    # run into the recursion limit; items are either ready made lines
+    # or nodes with their indentation level
+    stack = [(d, indent)]
+
+    while stack:
+
+        item = stack.pop()
+
+        if isinstance(item, str):
+
+            yield item
+            continue
+
+        node, ind = item
+
+        # if more items, branch
+        if not node:
+
+            continue
+
+        if isinstance(node, list):
+
+            stack.extend((sd, ind) for sd in reversed(node))
+
+        elif isinstance(node, dict):
+
+            prefix = '\t' * ind + '|\t'
+            todo = []
+            nested = False
+            typ = node.get('operatorType')
+
+            if typ:
+
+                todo.append(f'{prefix}{step}{typ}{step_end}')
+
+            for key, value in node.items():
+
+                if key in _NOT_LISTED:
+
+                    continue
+
+                elif key == 'args':
+
+                    todo.append((value, ind))
+                    nested = True
+
+                elif key in _TIME_KEYS:
+
+                    num = (
+                        format(value, ',').translate(_THOUSANDS_SEP)
+                            if isinstance(value, (int, float)) else
+                        value
+                    )
+                    todo.append(f'{prefix}{key}: {warning}{num}{endc}')
+
+                else:
+
+                    todo.append(f'{prefix}{key}: {value}')
+
+            chi = node.get('children')
+
+            if nested or chi:
+
+                # now the children
+                todo.append((chi, ind + 1))
+                stack.extend(reversed(todo))
+
+            else:
+
+                # leaf node, e.g. an item of an args list: nothing
+                # left to visit, no need for a round through the stack
+                yield from todo
+
+
 def pretty(d, lines: Optional[list]=None, indent: int=0) -> list:
     """
     Pretty format a Neo4j profile dict.
@@ -42,62 +145,65 @@ def pretty(d, lines: Optional[list]=None, indent: int=0) -> list:
     list and creates a list of strings to be printed.
     """
 
-    lines = lines or []
+    lines = [] if lines is None else lines
+    lines.extend(_pretty_lines(d, indent))
 
-    # if more items, branch
-    if d:
-        if isinstance(d, list):
-            for sd in d:
-                pretty(sd, lines, indent)
-        elif isinstance(d, dict):
-            typ = d.pop('operatorType', None)
-            if typ:
-                lines.append(
-                    ('\t' * (indent))
-                    + '|'
-                    + '\t'
-                    + f'{bcolors.OKBLUE}Step: {typ} {bcolors.ENDC}',
-                )
-
-            # buffer children
-            chi = d.pop('children', None)
-
-            for key, value in d.items():
-
-                if key == 'args':
-
-                    pretty(value, lines, indent)
-
-                # both are there for some reason, sometimes
-                # both in the same process
-                elif key == 'Time' or key == 'time':
-
-                    lines.append(
-                        ('\t' * (indent))
-                        + '|'
-                        + '\t'
-                        + str(key)
-                        + ': '
-                        + f'{bcolors.WARNING}{value:,}{bcolors.ENDC}'.replace(
-                            ',', ' ',
-                        ),
-                    )
+    return lines
 
-                else:
 
-                    lines.append(
-                        ('\t' * (indent))
-                        + '|'
-                        + '\t'
-                        + str(key)
-                        + ': '
-                        + str(value),
-                    )
+def pretty_to(buf: TextIO, d, indent: int = 0):
+    """
+    Write the pretty format of a Neo4j profile dict into a text buffer.
+
+    Args:
+        buf:
+            A file-like object with a `write` method, e.g. a file opened
+            for writing, `sys.stdout` or an `io.StringIO`.
+        d:
+            The profile or plan dict.
+        indent:
+            Indentation level of the top node.
+    """
 
-            # now the children
-            pretty(chi, lines, indent + 1)
+    write = buf.write
 
-    return lines
+    for line in _pretty_lines(d, indent):
+
+        write(line)
+        write('\n')
+
+
+def pretty_str(d, indent: int = 0) -> str:
+    """
+    Pretty format a Neo4j profile dict into a single string.
+
+    Returns:
+        The lines of :func:`pretty`, each ending with a newline.
+    """
+
+    buf = io.StringIO()
+    pretty_to(buf, d, indent)
+
+    return buf.getvalue()
+
+
+def pretty_print(d, file: Optional[TextIO] = None, indent: int = 0):
+    """
+    Print the pretty format of a Neo4j profile dict.
+
+    The lines are written as they are produced, no list or string of the
+    whole output is built.
+
+    Args:
+        d:
+            The profile or plan dict.
+        file:
+            Where to print; by default the standard output.
+        indent:
+            Indentation level of the top node.
+    """
+
+    pretty_to(sys.stdout if file is None else file, d, indent)
 
 
 def dict_str(dct: dict) -> str:
@@ -109,7 +215,7 @@ def dict_str(dct: dict) -> str:
 
         return str(dct)
 
-    return ', '.join(f'{str(key)}={str(val)}' for key, val in dct.items())
+    return ', '.join([f'{key}={val}' for key, val in dct.items()])
 
 
 def error_str(e: BaseException) -> str:
@@ -13,20 +13,15 @@
 A query focused interface.
 """
 
-import collections
+from typing import NamedTuple
 
 __all__ = ['Query']
 
 
-class Query(
-        collections.namedtuple('QueryBase', ('query', 'args')),
-):
+class Query(NamedTuple):
     """
     A Cypher query with arguments.
     """
 
-    pass
-
-
-Query.__new__.__defaults__ = (None,)
-Query.__annotations__ = {'query': str, 'args': dict | None}
+    query: str
+    args: dict | None = None